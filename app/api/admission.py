@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import heapq
+import itertools
+
+
+_STRUCTURE_WEIGHT = 4
+_STRUCTURE_CHARS = ("\n", "`", "<", "[", "{", "|", "*")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Formatter is overloaded")
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _Waiter:
+    cost: int
+    sequence: int
+    future: asyncio.Future[None] = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    abandoned: bool = field(default=False, compare=False)
+
+
+def estimate_format_cost(text: str) -> int:
+    structure = sum(text.count(char) for char in _STRUCTURE_CHARS)
+    return len(text) + _STRUCTURE_WEIGHT * structure + 1
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight_cost: int,
+        max_queued_cost: int,
+        queue_timeout: float,
+        retry_after: int,
+    ) -> None:
+        self._max_inflight_cost = max_inflight_cost
+        self._max_queued_cost = max_queued_cost
+        self._queue_timeout = queue_timeout
+        self._retry_after = retry_after
+        self._inflight_cost = 0
+        self._queued_cost = 0
+        self._waiters: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._admitted = 0
+        self._shed = 0
+
+    @asynccontextmanager
+    async def admit(self, cost: int) -> AsyncIterator[None]:
+        await self._acquire(cost)
+        try:
+            yield
+        finally:
+            self._release(cost)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "admitted": self._admitted,
+            "shed": self._shed,
+            "inflight_cost": self._inflight_cost,
+            "queued_cost": self._queued_cost,
+            "max_inflight_cost": self._max_inflight_cost,
+        }
+
+    async def _acquire(self, cost: int) -> None:
+        waiter = _Waiter(cost=cost, sequence=next(self._sequence), future=asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        self._queued_cost += cost
+        self._dispatch()
+        if waiter.granted:
+            return
+        if self._queued_cost > self._max_queued_cost:
+            self._abandon(waiter)
+            self._shed += 1
+            raise AdmissionRejected(self._retry_after)
+
+        try:
+            async with asyncio.timeout(self._queue_timeout):
+                await waiter.future
+        except TimeoutError:
+            if self._abandon(waiter):
+                self._shed += 1
+                raise AdmissionRejected(self._retry_after) from None
+        except BaseException:
+            if not self._abandon(waiter):
+                self._release(cost)
+            raise
+
+    def _release(self, cost: int) -> None:
+        self._inflight_cost -= cost
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.abandoned:
+                heapq.heappop(self._waiters)
+                continue
+            if not self._fits(waiter.cost):
+                return
+            heapq.heappop(self._waiters)
+            self._queued_cost -= waiter.cost
+            self._inflight_cost += waiter.cost
+            self._admitted += 1
+            waiter.granted = True
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        if waiter.granted:
+            return False
+        waiter.abandoned = True
+        self._queued_cost -= waiter.cost
+        self._dispatch()
+        return True
+
+    def _fits(self, cost: int) -> bool:
+        return self._inflight_cost == 0 or self._inflight_cost + cost <= self._max_inflight_cost
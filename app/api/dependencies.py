@@ -0,0 +1,66 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import hashlib
+from importlib import metadata
+import multiprocessing
+from pathlib import Path
+
+from api.admission import AdmissionController
+from api.jobs import JobManager
+from config.config import settings
+from domain.services import telegram_formatter
+from domain.services.result_cache import ResultCache
+
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> ResultCache | None:
+    if not settings.RESULT_CACHE_PATH:
+        return None
+    return ResultCache(
+        settings.RESULT_CACHE_PATH,
+        settings.RESULT_CACHE_MAX_BYTES,
+        namespace=_formatter_fingerprint(),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    return AdmissionController(
+        max_inflight_cost=settings.ADMISSION_MAX_INFLIGHT_COST,
+        max_queued_cost=settings.ADMISSION_MAX_QUEUED_COST,
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+        retry_after=settings.ADMISSION_RETRY_AFTER,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_job_manager() -> JobManager:
+    return JobManager(
+        executor_factory=partial(
+            ProcessPoolExecutor,
+            max_workers=settings.JOBS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        ),
+        max_pending=settings.JOBS_MAX_PENDING,
+        max_stored_bytes=settings.JOBS_MAX_STORED_BYTES,
+        result_ttl=settings.JOBS_RESULT_TTL,
+        retry_after=settings.ADMISSION_RETRY_AFTER,
+        callback_timeout=settings.JOBS_CALLBACK_TIMEOUT,
+        result_cache=get_result_cache(),
+    )
+
+
+def _formatter_fingerprint() -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    for distribution in ("telegram-formatter", "markdown-it-py"):
+        digest.update(f"{distribution}={_distribution_version(distribution)}\0".encode())
+    for path in sorted(Path(telegram_formatter.__file__).parent.glob("*.py")):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _distribution_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
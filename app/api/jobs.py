@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
+from dataclasses import dataclass, field
+from enum import StrEnum
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+from urllib.parse import urlsplit
+import urllib.request
+import uuid
+
+from domain.services.result_cache import ResultCache
+
+
+logger = logging.getLogger(__name__)
+
+_LOCAL_CALLBACK_HOSTS = frozenset({"localhost", "127.0.0.1", "::1"})
+_WARM_UP_TIMEOUT = 60.0
+_WARM_UP_POLL_INTERVAL = 0.05
+
+_worker_warmed = False
+
+
+class JobState(StrEnum):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobRejected(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Job queue is full")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    id: str
+    size_bytes: int
+    callback_url: str | None = None
+    state: JobState = JobState.PENDING
+    parts: list[str] | None = None
+    error: str | None = None
+    expires_at: float = float("inf")
+    finished: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.state.value,
+            "parts": None if self.parts is None else [{"text": part} for part in self.parts],
+            "error": self.error,
+        }
+
+
+def validate_callback_url(url: str) -> str:
+    parsed = urlsplit(url)
+    if parsed.scheme not in ("http", "https") or parsed.hostname not in _LOCAL_CALLBACK_HOSTS:
+        raise ValueError("callback_url must be an http(s) URL on localhost")
+    return url
+
+
+class JobManager:
+    def __init__(
+        self,
+        executor_factory: Callable[[], Executor],
+        max_pending: int,
+        max_stored_bytes: int,
+        result_ttl: float,
+        retry_after: int,
+        callback_timeout: float,
+        result_cache: ResultCache | None = None,
+    ) -> None:
+        self._executor_factory = executor_factory
+        self._executor: Executor | None = None
+        self._max_pending = max_pending
+        self._max_stored_bytes = max_stored_bytes
+        self._result_ttl = result_ttl
+        self._retry_after = retry_after
+        self._callback_timeout = callback_timeout
+        self._result_cache = result_cache
+        self._jobs: dict[str, Job] = {}
+        self._finished: OrderedDict[str, Job] = OrderedDict()
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._pending = 0
+        self._stored_bytes = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def submit(
+        self,
+        text: str,
+        variant: str,
+        call: Callable[[], list[str]],
+        callback_url: str | None = None,
+    ) -> Job:
+        self._purge()
+        size = _text_size(text)
+        if self._pending >= self._max_pending or not self._make_room(size):
+            self._rejected += 1
+            raise JobRejected(self._retry_after)
+
+        job = Job(id=uuid.uuid4().hex, size_bytes=size, callback_url=callback_url)
+        self._jobs[job.id] = job
+        self._stored_bytes += size
+        self._submitted += 1
+
+        self._pending += 1
+        self._spawn(self._run(job, text, variant, call))
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        self._purge()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        if timeout > 0:
+            with contextlib.suppress(TimeoutError):
+                async with asyncio.timeout(timeout):
+                    await job.finished.wait()
+        return job
+
+    async def warm_up(self, call: Callable[[], object], workers: int) -> int:
+        # A task goes to whichever worker is idle first, so keep submitting until every worker has answered;
+        # warmed workers reply without running `call` again.
+        executor = self._ensure_executor()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _WARM_UP_TIMEOUT
+        warmed: set[tuple[int, int]] = set()
+        while len(warmed) < workers and loop.time() < deadline:
+            answered = await asyncio.gather(
+                *(loop.run_in_executor(executor, _warm_worker, call) for _ in range(workers - len(warmed)))
+            )
+            if warmed.issuperset(answered):
+                await asyncio.sleep(_WARM_UP_POLL_INTERVAL)
+            warmed.update(answered)
+        if len(warmed) < workers:
+            logger.warning("Only %d of %d job workers warmed up", len(warmed), workers)
+        return len(warmed)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._reset_executor()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": self._pending,
+            "stored": len(self._jobs),
+            "stored_bytes": self._stored_bytes,
+            "max_stored_bytes": self._max_stored_bytes,
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "expired": self._expired,
+            "evicted": self._evicted,
+        }
+
+    async def _run(self, job: Job, text: str, variant: str, call: Callable[[], list[str]]) -> None:
+        loop = asyncio.get_running_loop()
+        executor: Executor | None = None
+        try:
+            parts = None
+            if self._result_cache is not None:
+                parts = await loop.run_in_executor(None, self._result_cache.get, text, variant)
+            if parts is None:
+                executor = self._ensure_executor()
+                parts = await loop.run_in_executor(executor, call)
+                if self._result_cache is not None:
+                    await loop.run_in_executor(None, self._result_cache.put, text, variant, parts)
+        except asyncio.CancelledError:
+            self._pending -= 1
+            self._finish(job, error="cancelled")
+            raise
+        except BrokenProcessPool as exc:
+            self._pending -= 1
+            logger.error("Job worker process died while running job %s; restarting the pool", job.id)
+            if self._executor is executor:
+                self._reset_executor()
+            self._finish(job, error=f"{type(exc).__name__}: {exc}")
+        except Exception as exc:
+            self._pending -= 1
+            logger.warning("Formatting job %s failed", job.id, exc_info=True)
+            self._finish(job, error=f"{type(exc).__name__}: {exc}")
+        else:
+            self._pending -= 1
+            self._finish(job, parts=parts)
+        await self._notify(job)
+
+    async def _notify(self, job: Job) -> None:
+        if job.callback_url is None:
+            return
+        body = json.dumps(job.as_dict(), ensure_ascii=False).encode("utf-8", "surrogatepass")
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._post, job.callback_url, body)
+        except Exception:
+            logger.warning("Callback for job %s to %s failed", job.id, job.callback_url, exc_info=True)
+
+    def _post(self, url: str, body: bytes) -> None:
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self._callback_timeout) as response:
+            response.read()
+
+    def _finish(self, job: Job, *, parts: list[str] | None = None, error: str | None = None) -> None:
+        size = _parts_size(parts) if parts is not None else 0
+        self._stored_bytes += size - job.size_bytes
+        job.size_bytes = size
+        job.parts = parts
+        job.error = error
+        job.state = JobState.DONE if error is None else JobState.FAILED
+        job.expires_at = time.monotonic() + self._result_ttl
+        self._finished[job.id] = job
+        if error is None:
+            self._completed += 1
+        else:
+            self._failed += 1
+        job.finished.set()
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        while self._finished:
+            job = next(iter(self._finished.values()))
+            if job.expires_at > now:
+                return
+            self._drop(job)
+            self._expired += 1
+
+    def _make_room(self, size: int) -> bool:
+        if size > self._max_stored_bytes:
+            return False
+        while self._stored_bytes + size > self._max_stored_bytes:
+            if not self._finished:
+                return False
+            self._drop(next(iter(self._finished.values())))
+            self._evicted += 1
+        return True
+
+    def _drop(self, job: Job) -> None:
+        del self._finished[job.id]
+        del self._jobs[job.id]
+        self._stored_bytes -= job.size_bytes
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    def _reset_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _spawn(self, coroutine: Any) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def _warm_worker(call: Callable[[], object]) -> tuple[int, int]:
+    global _worker_warmed
+    if not _worker_warmed:
+        call()
+        _worker_warmed = True
+    return os.getpid(), threading.get_ident()
+
+
+def _text_size(text: str) -> int:
+    return len(text.encode("utf-8", "surrogatepass"))
+
+
+def _parts_size(parts: list[str]) -> int:
+    return sum(_text_size(part) for part in parts)
@@ -1,22 +1,247 @@
-from fastapi import APIRouter
-from pydantic import BaseModel, Field
+from functools import partial
+from typing import Annotated
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from pydantic import BaseModel, Field, field_validator
+from starlette.concurrency import run_in_threadpool
+
+from api.admission import AdmissionController, AdmissionRejected, estimate_format_cost
+from api.dependencies import get_admission_controller, get_job_manager, get_result_cache
+from api.jobs import Job, JobManager, JobRejected, validate_callback_url
 from config.config import settings
-from domain.services.telegram_formatter import format_markdown_for_telegram
+from domain.services.result_cache import ResultCache
+from domain.services.telegram_formatter import (
+    DEFAULT_FORMAT_OPTIONS,
+    FormatOptions,
+    InputFormat,
+    format_markdown_for_telegram,
+    format_markdown_variants,
+    measure_markdown_for_telegram,
+)
+
+
+_MAX_PROFILES = 8
 
+PartLimits = Annotated[list[Annotated[int, Field(ge=1)]], Field(min_length=1)]
 
-class FormatRequest(BaseModel):
+
+class FormatSource(BaseModel):
     text: str = Field(..., description="Сообщение в формате Markdown")
+    format_json: bool = Field(True, description="Оформлять найденный в тексте JSON как блоки кода")
+    spoilers: bool = Field(True, description="Превращать ||текст|| в спойлеры")
+    input_format: InputFormat = Field(
+        "markdown",
+        description=(
+            "Формат входного текста: markdown, html (только разрешённые Telegram теги) или plain (текст как есть). "
+            "Оформление JSON и спойлеры применяются только к markdown"
+        ),
+    )
+
+    def options(self) -> FormatOptions:
+        return FormatOptions(format_json=self.format_json, spoilers=self.spoilers, input_format=self.input_format)
+
+
+class FormatRequest(FormatSource):
+    limits: PartLimits | None = Field(
+        None,
+        description=(
+            "Лимиты длины частей по порядку: первый — для первой части, последний действует для всех остальных "
+            "(например, [1024, 4096] для подписи к медиа и следующих сообщений). По умолчанию — "
+            "TELEGRAM_MAX_MESSAGE_LENGTH"
+        ),
+    )
+
+
+class FormatVariantsRequest(FormatSource):
+    profiles: dict[str, PartLimits] = Field(
+        ...,
+        min_length=1,
+        max_length=_MAX_PROFILES,
+        description="Именованные наборы лимитов частей; все варианты строятся из одного разбора текста",
+    )
+
+
+class FormatJobRequest(FormatRequest):
+    callback_url: str | None = Field(
+        None,
+        description="Локальный URL, на который будет отправлен POST с результатом задания",
+    )
+
+    @field_validator("callback_url")
+    @classmethod
+    def _validate_callback_url(cls, v: str | None) -> str | None:
+        return None if v is None else validate_callback_url(v)
 
 
 class MessagePart(BaseModel):
     text: str
 
 
+class PartSize(BaseModel):
+    length: int = Field(..., description="Длина части в символах текста без разметки")
+    entities: dict[str, int] = Field(..., description="Число сущностей (HTML-тегов) в части по тегу")
+
+
+class MeasureResponse(BaseModel):
+    count: int
+    parts: list[PartSize]
+
+
+class FormatJobStatus(BaseModel):
+    id: str
+    status: str
+    parts: list[MessagePart] | None = None
+    error: str | None = None
+
+
 router = APIRouter(prefix="/format", tags=["formatter"])
 
 
 @router.post("", response_model=list[MessagePart])
-async def format_message(payload: FormatRequest) -> list[MessagePart]:
-    parts = format_markdown_for_telegram(payload.text, settings.TELEGRAM_MAX_MESSAGE_LENGTH)
+async def format_message(
+    payload: FormatRequest,
+    result_cache: ResultCache | None = Depends(get_result_cache),
+    admission: AdmissionController = Depends(get_admission_controller),
+) -> list[MessagePart]:
+    limits = _part_limits(payload.limits)
+    options = payload.options()
+    variant = _cache_variant(limits, options)
+    parts = await run_in_threadpool(result_cache.get, payload.text, variant) if result_cache is not None else None
+    if parts is None:
+        try:
+            async with admission.admit(estimate_format_cost(payload.text)):
+                parts = await run_in_threadpool(format_markdown_for_telegram, payload.text, limits, options)
+        except AdmissionRejected as exc:
+            raise _service_unavailable("Formatter is overloaded, retry later", exc.retry_after) from exc
+        if result_cache is not None:
+            await run_in_threadpool(result_cache.put, payload.text, variant, parts)
     return [MessagePart(text=part) for part in parts]
+
+
+@router.post("/variants", response_model=dict[str, list[MessagePart]])
+async def format_message_variants(
+    payload: FormatVariantsRequest,
+    result_cache: ResultCache | None = Depends(get_result_cache),
+    admission: AdmissionController = Depends(get_admission_controller),
+) -> dict[str, list[MessagePart]]:
+    options = payload.options()
+    keys = {name: _cache_variant(limits, options) for name, limits in payload.profiles.items()}
+    variants: dict[str, list[str]] = {}
+    if result_cache is not None:
+        variants = await run_in_threadpool(_cached_variants, result_cache, payload.text, keys)
+    missing = {name: limits for name, limits in payload.profiles.items() if name not in variants}
+
+    if missing:
+        try:
+            async with admission.admit(estimate_format_cost(payload.text)):
+                formatted = await run_in_threadpool(format_markdown_variants, payload.text, missing, options)
+        except AdmissionRejected as exc:
+            raise _service_unavailable("Formatter is overloaded, retry later", exc.retry_after) from exc
+        if result_cache is not None:
+            await run_in_threadpool(_store_variants, result_cache, payload.text, keys, formatted)
+        variants.update(formatted)
+
+    return {name: [MessagePart(text=part) for part in variants[name]] for name in payload.profiles}
+
+
+@router.post("/measure", response_model=MeasureResponse)
+async def measure_message(
+    payload: FormatRequest,
+    admission: AdmissionController = Depends(get_admission_controller),
+) -> MeasureResponse:
+    try:
+        async with admission.admit(estimate_format_cost(payload.text)):
+            measures = await run_in_threadpool(
+                measure_markdown_for_telegram,
+                payload.text,
+                _part_limits(payload.limits),
+                payload.options(),
+            )
+    except AdmissionRejected as exc:
+        raise _service_unavailable("Formatter is overloaded, retry later", exc.retry_after) from exc
+    return MeasureResponse(
+        count=len(measures),
+        parts=[PartSize(length=measure.length, entities=measure.entities) for measure in measures],
+    )
+
+
+@router.post("/jobs", response_model=FormatJobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def submit_format_job(
+    payload: FormatJobRequest,
+    request: Request,
+    response: Response,
+    jobs: JobManager = Depends(get_job_manager),
+) -> FormatJobStatus:
+    limits = _part_limits(payload.limits)
+    options = payload.options()
+    try:
+        job = jobs.submit(
+            payload.text,
+            _cache_variant(limits, options),
+            partial(format_markdown_for_telegram, payload.text, limits, options),
+            callback_url=payload.callback_url,
+        )
+    except JobRejected as exc:
+        raise _service_unavailable("Job queue is full, retry later", exc.retry_after) from exc
+    response.headers["Location"] = str(request.url_for("get_format_job", job_id=job.id))
+    return _job_status(job)
+
+
+@router.get("/jobs/{job_id}", response_model=FormatJobStatus)
+async def get_format_job(
+    job_id: str,
+    wait: float = Query(0.0, ge=0, description="Сколько секунд ждать завершения задания (long-poll)"),
+    jobs: JobManager = Depends(get_job_manager),
+) -> FormatJobStatus:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found or expired")
+    await jobs.wait(job, min(wait, settings.JOBS_MAX_WAIT))
+    return _job_status(job)
+
+
+def _part_limits(limits: list[int] | None) -> list[int]:
+    return limits or [settings.TELEGRAM_MAX_MESSAGE_LENGTH]
+
+
+def _cache_variant(limits: list[int], options: FormatOptions) -> str:
+    if len(limits) == 1:
+        variant = f"max_length={limits[0]}"
+    else:
+        variant = "limits=" + ",".join(map(str, limits))
+    if options != DEFAULT_FORMAT_OPTIONS:
+        variant += (
+            f";format_json={int(options.format_json)},spoilers={int(options.spoilers)},input={options.input_format}"
+        )
+    return variant
+
+
+def _cached_variants(result_cache: ResultCache, text: str, keys: dict[str, str]) -> dict[str, list[str]]:
+    found: dict[str, list[str]] = {}
+    for name, variant in keys.items():
+        parts = result_cache.get(text, variant)
+        if parts is not None:
+            found[name] = parts
+    return found
+
+
+def _store_variants(
+    result_cache: ResultCache,
+    text: str,
+    keys: dict[str, str],
+    formatted: dict[str, list[str]],
+) -> None:
+    for name, parts in formatted.items():
+        result_cache.put(text, keys[name], parts)
+
+
+def _job_status(job: Job) -> FormatJobStatus:
+    return FormatJobStatus.model_validate(job.as_dict())
+
+
+def _service_unavailable(detail: str, retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(retry_after)},
+    )
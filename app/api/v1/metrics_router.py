@@ -0,0 +1,32 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends
+from starlette.concurrency import run_in_threadpool
+
+from api.admission import AdmissionController
+from api.dependencies import get_admission_controller, get_job_manager, get_result_cache
+from api.jobs import JobManager
+from domain.services.memory_profiler import memory_profiler
+from domain.services.result_cache import ResultCache
+from domain.services.telegram_formatter import block_cache
+
+
+router = APIRouter(prefix="/metrics", tags=["service"])
+
+
+@router.get("")
+async def metrics(
+    result_cache: ResultCache | None = Depends(get_result_cache),
+    admission: AdmissionController = Depends(get_admission_controller),
+    jobs: JobManager = Depends(get_job_manager),
+) -> dict[str, dict[str, Any]]:
+    report: dict[str, dict[str, Any]] = {
+        "block_cache": block_cache.stats().as_dict(),
+        "admission": dict(admission.stats()),
+        "jobs": dict(jobs.stats()),
+    }
+    if result_cache is not None:
+        report["result_cache"] = (await run_in_threadpool(result_cache.stats)).as_dict()
+    if memory_profiler.enabled:
+        report["memory_profile"] = memory_profiler.stats()
+    return report
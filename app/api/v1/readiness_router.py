@@ -0,0 +1,13 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from api.warmup import readiness
+
+
+router = APIRouter(prefix="/readiness", tags=["service"])
+
+
+@router.get("")
+async def readiness_check() -> JSONResponse:
+    status_code = status.HTTP_200_OK if readiness.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(readiness.as_dict(), status_code=status_code)
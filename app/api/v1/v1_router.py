@@ -2,9 +2,13 @@ from fastapi import APIRouter
 
 from .format_router import router as format_router
 from .healthcheck_router import router as healthcheck_router
+from .metrics_router import router as metrics_router
+from .readiness_router import router as readiness_router
 
 
 router = APIRouter(prefix="/v1")
 
 router.include_router(healthcheck_router)
+router.include_router(readiness_router)
 router.include_router(format_router)
+router.include_router(metrics_router)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from enum import StrEnum
+import logging
+import time
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+from api.jobs import JobManager
+from domain.services.telegram_formatter import FormatOptions, format_markdown_for_telegram
+
+
+logger = logging.getLogger(__name__)
+
+WARMUP_CORPUS: tuple[str, ...] = (
+    "# Заголовок\n\nПривет, **жирный**, *курсив*, ~~зачёркнутый~~, `код` и [ссылка](https://example.com).",
+    "- один\n- два\n  - вложенный\n\n1. первый\n2. второй\n\n> цитата\n> - список в цитате",
+    "```python\ndef f(x):\n    return x * 2\n```\n\n    отступ\n\n||спойлер|| и ![🙂](tg://emoji?id=1)",
+    'Ответ сервиса: {"user": {"id": 1, "tags": ["a", "b"]}, "ok": true} и [1, 2, 3]',
+    '<b>html</b> <i>теги</i> <a href="https://example.com">ссылка</a> <blockquote expandable>скрыто</blockquote>',
+    "Длинный абзац для разбиения на части. " * 40,
+)
+
+_WARMUP_OPTIONS = (
+    FormatOptions(),
+    FormatOptions(input_format="html"),
+    FormatOptions(input_format="plain"),
+)
+_WARMUP_LIMITS = (4096, [1024, 4096], 64)
+
+
+class ReadinessState(StrEnum):
+    STARTING = "starting"
+    READY = "ready"
+    FAILED = "failed"
+
+
+@dataclass
+class Readiness:
+    state: ReadinessState = ReadinessState.STARTING
+    startup_seconds: float | None = None
+    warmup_seconds: float | None = None
+    error: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state is ReadinessState.READY
+
+    def reset(self) -> None:
+        self.state = ReadinessState.STARTING
+        self.startup_seconds = None
+        self.warmup_seconds = None
+        self.error = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "status": self.state.value,
+            "startup_seconds": self.startup_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+
+readiness = Readiness()
+
+
+def warm_formatter() -> list[str]:
+    parts: list[str] = []
+    for text in WARMUP_CORPUS:
+        for options in _WARMUP_OPTIONS:
+            for limits in _WARMUP_LIMITS:
+                parts.extend(format_markdown_for_telegram(text, limits, options))
+    return parts
+
+
+async def warm_up(jobs: JobManager | None, job_workers: int, started: float) -> None:
+    warmup_started = time.monotonic()
+    warmed_workers = 0
+    try:
+        await run_in_threadpool(warm_formatter)
+        if jobs is not None:
+            warmed_workers = await jobs.warm_up(warm_formatter, job_workers)
+    except Exception as exc:
+        readiness.state = ReadinessState.FAILED
+        readiness.error = f"{type(exc).__name__}: {exc}"
+        logger.exception("Warm-up failed")
+        return
+
+    now = time.monotonic()
+    readiness.warmup_seconds = round(now - warmup_started, 3)
+    readiness.startup_seconds = round(now - started, 3)
+    readiness.state = ReadinessState.READY
+    logger.info(
+        "Ready in %.3fs (warm-up %.3fs, %d texts, %d job workers)",
+        readiness.startup_seconds,
+        readiness.warmup_seconds,
+        len(WARMUP_CORPUS),
+        warmed_workers,
+    )
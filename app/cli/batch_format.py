@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import argparse
+from collections import deque
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from functools import partial
+import json
+import logging
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
+import os
+from pathlib import Path
+import sys
+import time
+from typing import IO, Any
+
+from domain.services.telegram_formatter import format_markdown_for_telegram
+
+
+logger = logging.getLogger("batch_format")
+
+
+@dataclass(frozen=True)
+class _Record:
+    id: Any
+    text: str | None
+    error: str | None = None
+
+
+@dataclass
+class _Progress:
+    interval: float
+    started: float
+    reported: float
+    texts: int = 0
+    chars: int = 0
+
+    def advance(self, records: list[_Record]) -> None:
+        self.texts += len(records)
+        self.chars += sum(len(record.text or "") for record in records)
+        now = time.monotonic()
+        if self.interval > 0 and now - self.reported >= self.interval:
+            self.reported = now
+            self.report(now)
+
+    def report(self, now: float | None = None) -> None:
+        elapsed = max((now or time.monotonic()) - self.started, 1e-9)
+        logger.info(
+            "%d texts in %.1fs: %.1f texts/s, %.1f Mchars/s",
+            self.texts,
+            elapsed,
+            self.texts / elapsed,
+            self.chars / elapsed / 1_000_000,
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    records = _read_records(args.input)
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run_batch(
+            records,
+            output,
+            max_length=args.max_length,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            progress_interval=args.progress_interval,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+def run_batch(
+    records: Iterable[_Record],
+    output: IO[str],
+    *,
+    max_length: int,
+    workers: int,
+    chunksize: int,
+    progress_interval: float = 0.0,
+) -> None:
+    now = time.monotonic()
+    progress = _Progress(interval=progress_interval, started=now, reported=now)
+    formatter = partial(_format_text, max_length=max_length)
+    window = max(1, workers) * max(1, chunksize) * 4
+
+    if workers <= 1:
+        for batch in _batched(records, window):
+            _write_results(output, batch, [formatter(record.text) for record in batch])
+            progress.advance(batch)
+    else:
+        with Pool(processes=workers) as pool:
+            pending: deque[tuple[list[_Record], AsyncResult[list[list[str]]]]] = deque()
+            for batch in _batched(records, window):
+                pending.append((batch, pool.map_async(formatter, [record.text for record in batch], chunksize)))
+                if len(pending) > 2:
+                    done, result = pending.popleft()
+                    _write_results(output, done, result.get())
+                    progress.advance(done)
+            while pending:
+                done, result = pending.popleft()
+                _write_results(output, done, result.get())
+                progress.advance(done)
+
+    output.flush()
+    progress.report()
+
+
+def _format_text(text: str | None, max_length: int) -> list[str]:
+    if text is None:
+        return []
+    return format_markdown_for_telegram(text, max_length)
+
+
+def _write_results(output: IO[str], records: list[_Record], results: list[list[str]]) -> None:
+    lines: list[str] = []
+    for record, parts in zip(records, results, strict=True):
+        if record.error is not None:
+            payload: dict[str, Any] = {"id": record.id, "error": record.error}
+        else:
+            payload = {"id": record.id, "parts": [{"text": part} for part in parts]}
+        lines.append(json.dumps(payload, ensure_ascii=False))
+    if lines:
+        output.write("\n".join(lines) + "\n")
+
+
+def _read_records(source: str) -> Iterator[_Record]:
+    if source != "-" and Path(source).is_dir():
+        return _read_directory(Path(source))
+    if source == "-":
+        return _read_ndjson(sys.stdin)
+    return _read_ndjson_file(Path(source))
+
+
+def _read_ndjson_file(path: Path) -> Iterator[_Record]:
+    with path.open(encoding="utf-8") as stream:
+        yield from _read_ndjson(stream)
+
+
+def _read_ndjson(stream: IO[str]) -> Iterator[_Record]:
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip() == "":
+            continue
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield _Record(id=line_number, text=None, error=f"invalid JSON: {exc.msg}")
+            continue
+        if not isinstance(payload, dict) or not isinstance(payload.get("text"), str):
+            yield _Record(id=line_number, text=None, error='expected an object with a string "text" field')
+            continue
+        yield _Record(id=payload.get("id", line_number), text=payload["text"])
+
+
+def _read_directory(root: Path) -> Iterator[_Record]:
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        record_id = path.relative_to(root).as_posix()
+        try:
+            text = path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError) as exc:
+            yield _Record(id=record_id, text=None, error=str(exc))
+            continue
+        yield _Record(id=record_id, text=text)
+
+
+def _batched(records: Iterable[_Record], size: int) -> Iterator[list[_Record]]:
+    batch: list[_Record] = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m cli.batch_format",
+        description="Форматирование Markdown в Telegram HTML пакетно, без HTTP.",
+    )
+    parser.add_argument(
+        "input",
+        help='NDJSON-файл с объектами {"id": ..., "text": ...}, каталог с файлами или "-" (stdin)',
+    )
+    parser.add_argument("-o", "--output", default="-", help='NDJSON-файл для результатов, "-" — stdout')
+    parser.add_argument("--max-length", type=int, default=4096, help="Максимальная длина части сообщения")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Число процессов")
+    parser.add_argument("--chunksize", type=int, default=64, help="Число текстов в одной задаче процесса")
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=5.0,
+        help="Интервал отчёта о пропускной способности в секундах (0 — только итог)",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,11 +18,86 @@ class Settings(BaseSettings):
     # App path settings
     API_ROOT_PATH: str = Field("/api", description="Базовый путь приложения (FastAPI root_path)")
 
+    # Server settings
+    SERVER_TCP_ENABLED: bool = Field(True, description="Слушать TCP-сокет")
+    SERVER_HOST: str = Field("0.0.0.0", description="Адрес TCP-сокета")
+    SERVER_PORT: int = Field(9000, ge=1, le=65535, description="Порт TCP-сокета")
+    SERVER_UDS_PATH: str | None = Field(None, description="Путь к Unix domain socket (пусто — не использовать)")
+    SERVER_KEEP_ALIVE_TIMEOUT: int = Field(5, ge=0, description="Таймаут keep-alive соединений в секундах")
+    SERVER_BACKLOG: int = Field(2048, ge=1, description="Размер очереди входящих соединений сокета")
+    SERVER_LIMIT_CONCURRENCY: int | None = Field(
+        None,
+        ge=1,
+        description="Максимум одновременных соединений и задач суммарно по всем слушателям (пусто — без ограничения)",
+    )
+
+    # Admission control settings
+    ADMISSION_MAX_INFLIGHT_COST: int = Field(
+        2_000_000,
+        ge=1,
+        description="Суммарная оценочная стоимость одновременно обрабатываемых запросов форматирования",
+    )
+    ADMISSION_MAX_QUEUED_COST: int = Field(
+        8_000_000,
+        ge=0,
+        description="Суммарная стоимость запросов в очереди, сверх которой новые запросы отклоняются с 503",
+    )
+    ADMISSION_QUEUE_TIMEOUT: float = Field(5.0, gt=0, description="Максимальное ожидание в очереди в секундах")
+    ADMISSION_RETRY_AFTER: int = Field(1, ge=0, description="Значение заголовка Retry-After для ответов 503")
+
+    # Background job settings
+    JOBS_WORKERS: int = Field(2, ge=1, description="Число процессов для фоновых заданий форматирования")
+    JOBS_MAX_PENDING: int = Field(64, ge=1, description="Максимум заданий в очереди и в работе одновременно")
+    JOBS_MAX_STORED_BYTES: int = Field(
+        128 * 1024 * 1024,
+        ge=1,
+        description="Лимит памяти под тексты ожидающих заданий и результаты завершённых в байтах",
+    )
+    JOBS_RESULT_TTL: float = Field(600.0, gt=0, description="Время хранения результата задания в секундах")
+    JOBS_MAX_WAIT: float = Field(30.0, ge=0, description="Максимальное время long-poll ожидания результата в секундах")
+    JOBS_CALLBACK_TIMEOUT: float = Field(5.0, gt=0, description="Таймаут вызова callback URL в секундах")
+
+    # Startup settings
+    WARMUP_ENABLED: bool = Field(True, description="Прогревать форматтер встроенным корпусом перед готовностью")
+    WARMUP_JOB_WORKERS: bool = Field(True, description="Запускать и прогревать процессы фоновых заданий при старте")
+
     # Logging settings
     LOG_LEVEL: LogLevels = Field("INFO", description="Уровень логирования")
 
     # Telegram formatting settings
     TELEGRAM_MAX_MESSAGE_LENGTH: int = Field(4096, ge=1, description="Максимальная длина сообщения Telegram")
+    FORMAT_BLOCK_CACHE_MAX_BYTES: int = Field(
+        0,
+        ge=0,
+        description="Лимит памяти кэша отформатированных Markdown-блоков в байтах (0 — кэш выключен)",
+    )
+    MEMORY_PROFILE_SAMPLE_RATE: float = Field(
+        0.0,
+        ge=0,
+        le=1,
+        description="Доля запросов форматирования, профилируемых через tracemalloc (0 — профилирование выключено)",
+    )
+    MEMORY_PROFILE_TOP_SITES: int = Field(
+        5,
+        ge=0,
+        description="Число мест с наибольшими аллокациями, сохраняемых для каждого этапа",
+    )
+    RESULT_CACHE_PATH: str | None = Field(
+        None,
+        description="Файл общего для всех воркеров кэша результатов (пусто — кэш выключен)",
+    )
+    RESULT_CACHE_MAX_BYTES: int = Field(
+        64 * 1024 * 1024,
+        ge=1,
+        description="Лимит размера общего кэша результатов в байтах",
+    )
+
+    @field_validator("SERVER_UDS_PATH", "SERVER_LIMIT_CONCURRENCY", "RESULT_CACHE_PATH", mode="before")
+    @classmethod
+    def _parse_optional(cls, v):
+        if isinstance(v, str) and v.strip() == "":
+            return None
+        return v
 
     @field_validator("API_ROOT_PATH", mode="before")
     @classmethod
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+import threading
+from typing import Generic, TypeVar
+
+
+V = TypeVar("V")
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    entries: int
+    size_bytes: int
+    max_bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "entries": self.entries,
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class BlockCache(Generic[V]):
+    def __init__(self, max_bytes: int, sizeof: Callable[[V], int]) -> None:
+        self._max_bytes = max(0, max_bytes)
+        self._sizeof = sizeof
+        self._entries: OrderedDict[Hashable, tuple[V, int]] = OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_bytes > 0
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: V) -> None:
+        size = self._sizeof(value)
+        with self._lock:
+            if size > self._max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._size_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self._max_bytes = max(0, max_bytes)
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                entries=len(self._entries),
+                size_bytes=self._size_bytes,
+                max_bytes=self._max_bytes,
+            )
+
+    def _evict(self) -> None:
+        while self._entries and self._size_bytes > self._max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size_bytes -= size
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+import logging
+import random
+import threading
+import tracemalloc
+from typing import Any
+
+
+logger = logging.getLogger(__name__)
+
+_SELF_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+)
+
+
+@dataclass(frozen=True)
+class StageMemory:
+    name: str
+    peak_bytes: int
+    retained_bytes: int
+    top_sites: tuple[str, ...]
+
+
+@dataclass
+class MemoryProfile:
+    input_chars: int
+    top_sites: int
+    stages: list[StageMemory] = field(default_factory=list)
+    concurrent_calls: int = 0
+
+    @property
+    def peak_bytes(self) -> int:
+        return max((stage.peak_bytes for stage in self.stages), default=0)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        before = _snapshot() if self.top_sites else None
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            sites: tuple[str, ...] = ()
+            if before is not None:
+                after = _snapshot()
+                sites = tuple(_format_site(diff) for diff in after.compare_to(before, "lineno")[: self.top_sites])
+            self.stages.append(
+                StageMemory(
+                    name=name,
+                    peak_bytes=max(0, peak - baseline),
+                    retained_bytes=current - baseline,
+                    top_sites=sites,
+                )
+            )
+
+
+@dataclass
+class _StageSummary:
+    samples: int = 0
+    peak_bytes_last: int = 0
+    peak_bytes_max: int = 0
+    peak_bytes_per_char_max: float = 0.0
+    top_sites: tuple[str, ...] = ()
+
+    def add(self, stage: StageMemory, input_chars: int) -> None:
+        self.samples += 1
+        self.peak_bytes_last = stage.peak_bytes
+        self.peak_bytes_per_char_max = max(self.peak_bytes_per_char_max, stage.peak_bytes / max(1, input_chars))
+        if stage.peak_bytes >= self.peak_bytes_max:
+            self.peak_bytes_max = stage.peak_bytes
+            self.top_sites = stage.top_sites
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "peak_bytes_last": self.peak_bytes_last,
+            "peak_bytes_max": self.peak_bytes_max,
+            "peak_bytes_per_char_max": round(self.peak_bytes_per_char_max, 2),
+            "top_sites": list(self.top_sites),
+        }
+
+
+class MemoryProfiler:
+    def __init__(self, sample_rate: float = 0.0, top_sites: int = 5) -> None:
+        self._sample_rate = 0.0
+        self._top_sites = 0
+        self._busy = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stages: dict[str, _StageSummary] = {}
+        self._skipped = 0
+        self._contaminated = 0
+        self._active = 0
+        self._profiling = False
+        self._overlapping = 0
+        self.configure(sample_rate, top_sites)
+
+    @property
+    def enabled(self) -> bool:
+        return self._sample_rate > 0
+
+    def configure(self, sample_rate: float, top_sites: int = 5) -> None:
+        self._sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self._top_sites = max(0, top_sites)
+
+    def should_sample(self) -> bool:
+        return self._sample_rate >= 1.0 or random.random() < self._sample_rate
+
+    def track(self) -> AbstractContextManager[None]:
+        if not self.enabled:
+            return nullcontext()
+        return self._track()
+
+    @contextmanager
+    def profile(self, input_chars: int, top_sites: int | None = None) -> Iterator[MemoryProfile | None]:
+        # tracemalloc and its peak are process-wide: allocations of every other thread land in the sampled
+        # stages. One request is profiled at a time and the sample is discarded if any other formatting
+        # call overlapped it; allocations outside the formatter (request handling, I/O) are still counted.
+        if not self._busy.acquire(blocking=False):
+            with self._stats_lock:
+                self._skipped += 1
+            with self._track():
+                yield None
+            return
+
+        with self._stats_lock:
+            self._profiling = True
+            self._overlapping = self._active
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        profile = MemoryProfile(input_chars=input_chars, top_sites=self._top_sites if top_sites is None else top_sites)
+        try:
+            yield profile
+        finally:
+            if started:
+                tracemalloc.stop()
+            with self._stats_lock:
+                self._profiling = False
+                profile.concurrent_calls = self._overlapping
+            self._busy.release()
+        self._record(profile)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "sample_rate": self._sample_rate,
+                "skipped": self._skipped,
+                "contaminated": self._contaminated,
+                "stages": {name: summary.as_dict() for name, summary in self._stages.items()},
+            }
+
+    def clear(self) -> None:
+        with self._stats_lock:
+            self._stages.clear()
+            self._skipped = 0
+            self._contaminated = 0
+
+    @contextmanager
+    def _track(self) -> Iterator[None]:
+        with self._stats_lock:
+            self._active += 1
+            if self._profiling:
+                self._overlapping += 1
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self._active -= 1
+
+    def _record(self, profile: MemoryProfile) -> None:
+        if profile.concurrent_calls:
+            with self._stats_lock:
+                self._contaminated += 1
+            logger.debug(
+                "Memory profile of %d chars discarded: %d concurrent formatting calls",
+                profile.input_chars,
+                profile.concurrent_calls,
+            )
+            return
+        with self._stats_lock:
+            for stage in profile.stages:
+                self._stages.setdefault(stage.name, _StageSummary()).add(stage, profile.input_chars)
+        logger.info(
+            "Memory profile: %d chars, peak %d bytes; %s",
+            profile.input_chars,
+            profile.peak_bytes,
+            "; ".join(
+                f"{stage.name} peak={stage.peak_bytes} retained={stage.retained_bytes}"
+                + (f" top=[{', '.join(stage.top_sites)}]" if stage.top_sites else "")
+                for stage in profile.stages
+            ),
+        )
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SELF_FILTERS)
+
+
+def _format_site(diff: tracemalloc.StatisticDiff) -> str:
+    frame = diff.traceback[0]
+    return f"{frame.filename.rsplit('/', 1)[-1]}:{frame.lineno} {diff.size_diff:+d}B"
+
+
+memory_profiler = MemoryProfiler()
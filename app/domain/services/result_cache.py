@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from .block_cache import CacheStats
+
+
+logger = logging.getLogger(__name__)
+
+_TOUCH_INTERVAL_SECONDS = 30.0
+_EVICTION_BATCH = 64
+_BUSY_TIMEOUT_MS = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key BLOB PRIMARY KEY,
+    parts TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (id, total_size) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE meta SET total_size = total_size + new.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE meta SET total_size = total_size + new.size - old.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE meta SET total_size = total_size - old.size WHERE id = 0;
+END;
+"""
+
+
+class ResultCache:
+    def __init__(self, path: str, max_bytes: int, namespace: str = "") -> None:
+        self._path = path
+        self._max_bytes = max(0, max_bytes)
+        self._namespace = namespace
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+
+    def get(self, text: str, variant: str) -> list[str] | None:
+        key = _make_key(self._namespace, variant, text)
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT parts, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                now = time.time()
+                if now - row[1] > _TOUCH_INTERVAL_SECONDS:
+                    with connection:
+                        connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            logger.warning("Result cache lookup failed", exc_info=True)
+            row = None
+
+        self._count(hit=row is not None)
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, text: str, variant: str, parts: list[str]) -> None:
+        key = _make_key(self._namespace, variant, text)
+        payload = json.dumps(parts, ensure_ascii=False)
+        size = len(key) + len(payload.encode("utf-8", "surrogatepass"))
+        if size > self._max_bytes:
+            return
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "INSERT INTO entries (key, parts, size, accessed) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET parts = excluded.parts, size = excluded.size, "
+                    "accessed = excluded.accessed",
+                    (key, payload, size, time.time()),
+                )
+                self._evict(connection)
+        except (sqlite3.Error, UnicodeEncodeError):
+            logger.warning("Result cache store failed", exc_info=True)
+
+    def stats(self) -> CacheStats:
+        entries = 0
+        size_bytes = 0
+        try:
+            connection = self._connection()
+            entries = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size_bytes = connection.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+        except sqlite3.Error:
+            logger.warning("Result cache stats failed", exc_info=True)
+        with self._stats_lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                entries=entries,
+                size_bytes=size_bytes,
+                max_bytes=self._max_bytes,
+            )
+
+    def clear(self) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM entries")
+        with self._stats_lock:
+            self._hits = 0
+            self._misses = 0
+
+    def close(self) -> None:
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is not None and getattr(self._local, "pid", None) == os.getpid():
+            connection.close()
+        self._local.connection = None
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        while connection.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0] > self._max_bytes:
+            deleted = connection.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                (_EVICTION_BATCH,),
+            ).rowcount
+            if deleted == 0:
+                return
+
+    def _connection(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None or getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=_BUSY_TIMEOUT_MS / 1000)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute(f"PRAGMA mmap_size = {int(self._max_bytes * 2)}")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+
+def _make_key(namespace: str, variant: str, text: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=20)
+    for field in (namespace, variant):
+        digest.update(field.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(text.encode("utf-8", "surrogatepass"))
+    return digest.digest()
@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+from collections.abc import Callable, Mapping, Sequence
 from dataclasses import dataclass
+from functools import lru_cache
+import hashlib
 import html
 from html.parser import HTMLParser
 import json
 import re
+import sys
+from typing import Literal
 import uuid
 
 from markdown_it import MarkdownIt
+from markdown_it.rules_core import block, normalize
+from markdown_it.rules_core.state_core import StateCore
+from markdown_it.token import Token
+
+from .block_cache import BlockCache
+from .memory_profiler import memory_profiler
 
 
 _CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
@@ -16,6 +27,20 @@ _INLINE_CODE_RE = re.compile(r"`([^`\n]+)`")
 _SPOILER_RE = re.compile(r"\|\|(.+?)\|\|", re.DOTALL)
 _TG_EMOJI_ID_RE = re.compile(r"^tg://emoji\?id=(\d+)$", re.IGNORECASE)
 _JSON_START_RE = re.compile(r"[\[{]")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_PLACEHOLDER_RE = re.compile(r"TGPHTOKEN([0-9a-f]{32})N([0-9]+)X")
+
+_JSON_SCAN_BUDGET_FACTOR = 4
+# Spent before the factor matters, so short texts are formatted exactly as without a budget.
+_JSON_SCAN_BUDGET_FLOOR = 64 * 1024
+_JSON_RECURSION_SCAN_COST = 1024
+
+_MERGEABLE_TAGS = frozenset({"b", "i", "u", "s", "span", "code", "a"})
+_PREFORMATTED_TAGS = frozenset({"pre", "code"})
+
+# Off until enabled: a cold block-cached render still costs more than one whole-document render.
+_BLOCK_CACHE_DEFAULT_MAX_BYTES = 0
+_BLOCK_CACHE_TOKEN_OVERHEAD_BYTES = 96
 
 
 @dataclass(frozen=True)
@@ -26,17 +51,139 @@ class _HtmlToken:
     text: str | None = None
 
 
-def format_markdown_for_telegram(text: str, max_length: int) -> list[str]:
+def _estimate_fragment_size(fragment: tuple[_HtmlToken, ...]) -> int:
+    return sum(_BLOCK_CACHE_TOKEN_OVERHEAD_BYTES + len(token.text or "") for token in fragment)
+
+
+block_cache: BlockCache[tuple[_HtmlToken, ...]] = BlockCache(_BLOCK_CACHE_DEFAULT_MAX_BYTES, _estimate_fragment_size)
+
+_BOUNDARY_PRIMERS: dict[str, _HtmlToken | None] = {
+    "empty": None,
+    "newline": _HtmlToken(kind="text", text="\n"),
+    "text": _HtmlToken(kind="text", text="."),
+    "end": _HtmlToken(kind="end", tag="p"),
+}
+
+
+@dataclass(frozen=True)
+class PartMeasure:
+    length: int
+    entities: dict[str, int]
+
+
+Limits = int | Sequence[int]
+InputFormat = Literal["markdown", "html", "plain"]
+
+
+@dataclass(frozen=True)
+class FormatOptions:
+    format_json: bool = True
+    spoilers: bool = True
+    input_format: InputFormat = "markdown"
+
+
+DEFAULT_FORMAT_OPTIONS = FormatOptions()
+
+
+def format_markdown_for_telegram(
+    text: str,
+    max_length: Limits,
+    options: FormatOptions = DEFAULT_FORMAT_OPTIONS,
+) -> list[str]:
+    if memory_profiler.enabled and memory_profiler.should_sample():
+        return _format_profiled(text, max_length, options)
+    with memory_profiler.track():
+        tokens = _prepare_tokens(text, options)
+        if tokens is None:
+            return []
+        return _split_tokens(tokens, max_length)
+
+
+def measure_markdown_for_telegram(
+    text: str,
+    max_length: Limits,
+    options: FormatOptions = DEFAULT_FORMAT_OPTIONS,
+) -> list[PartMeasure]:
+    with memory_profiler.track():
+        tokens = _prepare_tokens(text, options)
+        if tokens is None:
+            return []
+        return _measure_tokens(tokens, max_length)
+
+
+def format_markdown_variants(
+    text: str,
+    profiles: Mapping[str, Limits],
+    options: FormatOptions = DEFAULT_FORMAT_OPTIONS,
+) -> dict[str, list[str]]:
+    with memory_profiler.track():
+        tokens = _prepare_tokens(text, options)
+        if tokens is None:
+            return {name: [] for name in profiles}
+        return {name: _split_tokens(tokens, limits) for name, limits in profiles.items()}
+
+
+def _prepare_tokens(text: str, options: FormatOptions) -> list[_HtmlToken] | None:
     cleaned = _sanitize_text(text)
     if cleaned.strip() == "":
-        return []
+        return None
 
-    prepared = _format_json_blocks(cleaned)
-    prepared = _replace_spoilers(prepared)
-    html_text = _markdown_to_html(prepared)
-    tokens = _sanitize_html(html_text)
+    prepared = cleaned
+    for _, stage in _source_stages(options):
+        prepared = stage(prepared)
+    tokens = _PARSERS[options.input_format](prepared)
+    return _finish_tokens(tokens, options)
+
+
+def _format_profiled(
+    text: str,
+    max_length: Limits,
+    options: FormatOptions = DEFAULT_FORMAT_OPTIONS,
+    top_sites: int | None = None,
+) -> list[str]:
+    with memory_profiler.profile(len(text), top_sites) as profile:
+        if profile is None:
+            tokens = _prepare_tokens(text, options)
+            return [] if tokens is None else _split_tokens(tokens, max_length)
+
+        with profile.stage("sanitize"):
+            cleaned = _sanitize_text(text)
+        if cleaned.strip() == "":
+            return []
+        prepared = cleaned
+        for name, stage in _source_stages(options):
+            with profile.stage(name):
+                prepared = stage(prepared)
+        with profile.stage(options.input_format):
+            tokens = _PARSERS[options.input_format](prepared)
+        with profile.stage("compact"):
+            tokens = _finish_tokens(tokens, options)
+        with profile.stage("split"):
+            return _split_tokens(tokens, max_length)
+
+
+def _finish_tokens(tokens: list[_HtmlToken], options: FormatOptions) -> list[_HtmlToken]:
     tokens = _trim_trailing_newlines(tokens)
-    return _split_tokens(tokens, max_length)
+    if options.input_format == "plain":
+        return tokens
+    # Blank lines in hand-written HTML are meant as written; only markdown-it output is collapsed.
+    return _compact_tokens(tokens, collapse_blank_lines=options.input_format == "markdown")
+
+
+@lru_cache(maxsize=8)
+def _source_stages(options: FormatOptions) -> tuple[tuple[str, Callable[[str], str]], ...]:
+    if options.input_format != "markdown":
+        return ()
+    stages: list[tuple[str, Callable[[str], str]]] = []
+    if options.format_json:
+        stages.append(("json", _format_json_blocks))
+    if options.spoilers:
+        stages.append(("spoilers", _replace_spoilers))
+    return tuple(stages)
+
+
+def _plain_to_tokens(text: str) -> list[_HtmlToken]:
+    return [_HtmlToken(kind="text", text=text)]
 
 
 def _sanitize_text(text: str) -> str:
@@ -45,34 +192,49 @@ def _sanitize_text(text: str) -> str:
 
 
 def _replace_spoilers(text: str) -> str:
-    protected, tokens = _stash_code_segments(text)
+    protected, stash = _stash_code_segments(text)
     protected = _SPOILER_RE.sub(r'<span class="tg-spoiler">\1</span>', protected)
-    return _restore_code_segments(protected, tokens)
+    return _restore_code_segments(protected, stash)
 
 
 def _format_json_blocks(text: str) -> str:
-    protected, tokens = _stash_code_segments(text)
+    protected, stash = _stash_code_segments(text)
     formatted = _format_json_in_text(protected)
-    return _restore_code_segments(formatted, tokens)
+    return _restore_code_segments(formatted, stash)
+
+
+@dataclass(frozen=True)
+class _CodeStash:
+    nonce: str
+    segments: list[str]
 
 
-def _stash_code_segments(text: str) -> tuple[str, list[tuple[str, str]]]:
-    tokens: list[tuple[str, str]] = []
+def _stash_code_segments(text: str) -> tuple[str, _CodeStash]:
+    if "`" not in text:
+        return text, _CodeStash(nonce="", segments=[])
+    nonce = _unique_placeholder_nonce(text)
+    segments: list[str] = []
 
     def stash(match: re.Match[str]) -> str:
-        placeholder = _unique_placeholder(text)
-        tokens.append((placeholder, match.group(0)))
-        return placeholder
+        segments.append(match.group(0))
+        return f"TGPHTOKEN{nonce}N{len(segments) - 1}X"
 
     protected = _CODE_BLOCK_RE.sub(stash, text)
     protected = _INLINE_CODE_RE.sub(stash, protected)
-    return protected, tokens
+    return protected, _CodeStash(nonce=nonce, segments=segments)
+
 
+def _restore_code_segments(text: str, stash: _CodeStash) -> str:
+    if not stash.segments:
+        return text
 
-def _restore_code_segments(text: str, tokens: list[tuple[str, str]]) -> str:
-    for placeholder, original in tokens:
-        text = text.replace(placeholder, original)
-    return text
+    def restore(match: re.Match[str]) -> str:
+        # Placeholder-shaped text from the input carries another nonce and stays as written.
+        if match.group(1) != stash.nonce:
+            return match.group(0)
+        return _PLACEHOLDER_RE.sub(restore, stash.segments[int(match.group(2))])
+
+    return _PLACEHOLDER_RE.sub(restore, text)
 
 
 def _format_json_in_text(text: str) -> str:
@@ -80,6 +242,7 @@ def _format_json_in_text(text: str) -> str:
     parts: list[str] = []
     index = 0
     last_char = ""
+    scan_budget = _JSON_SCAN_BUDGET_FACTOR * len(text) + _JSON_SCAN_BUDGET_FLOOR
 
     while index < len(text):
         match = _JSON_START_RE.search(text, index)
@@ -96,9 +259,17 @@ def _format_json_in_text(text: str) -> str:
         if prefix:
             last_char = prefix[-1]
 
+        if scan_budget <= 0:
+            parts.append(text[start:])
+            break
+
         try:
-            parsed, end = decoder.raw_decode(text[start:])
-        except json.JSONDecodeError:
+            parsed, end = decoder.raw_decode(text, start)
+        except (json.JSONDecodeError, RecursionError) as exc:
+            if isinstance(exc, json.JSONDecodeError):
+                scan_budget -= exc.pos - start + 1
+            else:
+                scan_budget -= _JSON_RECURSION_SCAN_COST
             parts.append(text[start])
             last_char = text[start]
             index = start + 1
@@ -112,7 +283,7 @@ def _format_json_in_text(text: str) -> str:
 
         pretty = json.dumps(parsed, ensure_ascii=False, indent=2)
         needs_leading = last_char not in ("", "\n")
-        next_char = text[start + end : start + end + 1]
+        next_char = text[end : end + 1]
         needs_trailing = next_char not in ("", "\n")
         leading = "\n" if needs_leading else ""
         trailing = "\n" if needs_trailing else ""
@@ -120,24 +291,154 @@ def _format_json_in_text(text: str) -> str:
         parts.append(block)
         if block:
             last_char = block[-1]
-        index = start + end
+        index = end
 
     return "".join(parts)
 
 
-def _markdown_to_html(text: str) -> str:
+@lru_cache(maxsize=1)
+def _markdown_parser() -> MarkdownIt:
     md = MarkdownIt("commonmark", {"html": True})
     md.enable("strikethrough")
-    return md.render(text)
+    return md
+
+
+def _markdown_to_html(text: str) -> str:
+    return _markdown_parser().render(text)
+
+
+def _markdown_to_tokens(text: str) -> list[_HtmlToken]:
+    if block_cache.enabled:
+        tokens = _markdown_to_tokens_cached(text)
+        if tokens is not None:
+            return tokens
+    return _sanitize_html(_markdown_to_html(text))
+
+
+def _markdown_to_tokens_cached(text: str) -> list[_HtmlToken] | None:
+    md = _markdown_parser()
+    env: dict[str, object] = {}
+    blocks = _split_top_level_blocks(text, env)
+    if blocks is None:
+        return None
+
+    tokens: list[_HtmlToken] = []
+    for source, block_tokens in blocks:
+        boundary = _boundary_kind(tokens)
+        if boundary not in _BOUNDARY_PRIMERS:
+            return None
+        key = (hashlib.blake2b(source.encode("utf-8", "surrogatepass"), digest_size=16).digest(), boundary)
+        fragment = block_cache.get(key)
+        if fragment is None:
+            # Reuse the block tokens of the whole-document parse: only inline parsing and rendering are left.
+            state = StateCore("", md, env)
+            state.tokens = block_tokens
+            for rule in _inline_core_rules():
+                rule(state)
+            fragment = _sanitize_block(md.renderer.render(block_tokens, md.options, env), _BOUNDARY_PRIMERS[boundary])
+            if fragment is None:
+                return None
+            block_cache.put(key, fragment)
+        _extend_tokens(tokens, fragment)
+    return tokens
+
+
+@lru_cache(maxsize=1)
+def _inline_core_rules() -> tuple[Callable[[StateCore], None], ...]:
+    return tuple(rule for rule in _markdown_parser().core.ruler.getRules("") if rule not in (normalize, block))
+
+
+def _split_top_level_blocks(text: str, env: dict[str, object]) -> list[tuple[str, list[Token]]] | None:
+    md = _markdown_parser()
+    block_tokens: list[Token] = []
+    md.block.parse(text, md, env, block_tokens)
+    if env.get("references"):
+        return None
+
+    starts = [
+        index for index, token in enumerate(block_tokens) if token.level == 0 and token.nesting >= 0 and token.map
+    ]
+    # The whole-document parse merges an indented HTML block's leading spaces into the preceding
+    # "\n" and drops them as inter-block whitespace; a block sanitised on its own keeps them.
+    if any(
+        block_tokens[index].type == "html_block" and block_tokens[index].content[:1].isspace() for index in starts[1:]
+    ):
+        return None
+
+    line_offsets = [0]
+    for line in text.split("\n"):
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+
+    blocks: list[tuple[str, list[Token]]] = []
+    for position, index in enumerate(starts):
+        start_line, end_line = block_tokens[index].map or (0, 0)
+        if position == len(starts) - 1:
+            blocks.append((text[line_offsets[start_line] :], block_tokens[index:]))
+        else:
+            next_index = starts[position + 1]
+            blocks.append((text[line_offsets[start_line] : line_offsets[end_line]], block_tokens[index:next_index]))
+    return blocks
 
 
-def _sanitize_html(text: str) -> list[_HtmlToken]:
+def _sanitize_block(html_text: str, primer: _HtmlToken | None) -> tuple[_HtmlToken, ...] | None:
     parser = _TelegramHTMLSanitizer()
+    if primer is not None:
+        parser.tokens.append(primer)
+    parser.feed(html_text)
+    if not parser.at_block_boundary():
+        return None
+    parser.close()
+
+    tokens = parser.tokens
+    if primer is None:
+        return tuple(tokens)
+    first = tokens[0]
+    if first is primer:
+        return tuple(tokens[1:])
+    rest = (first.text or "")[len(primer.text or "") :]
+    head = [_HtmlToken(kind="text", text=rest)] if rest else []
+    return tuple(head + tokens[1:])
+
+
+def _boundary_kind(tokens: list[_HtmlToken]) -> str:
+    if not tokens:
+        return "empty"
+    last = tokens[-1]
+    if last.kind == "text" and last.text is not None:
+        return "newline" if last.text.endswith("\n") else "text"
+    return last.kind
+
+
+def _extend_tokens(tokens: list[_HtmlToken], fragment: tuple[_HtmlToken, ...]) -> None:
+    if not fragment:
+        return
+    first = fragment[0]
+    last = tokens[-1] if tokens else None
+    if last is not None and last.text is not None and last.kind == "text" and first.kind == "text":
+        tokens[-1] = _HtmlToken(kind="text", text=last.text + (first.text or ""))
+        tokens.extend(fragment[1:])
+        return
+    tokens.extend(fragment)
+
+
+def _sanitize_html(text: str, keep_whitespace: bool = False) -> list[_HtmlToken]:
+    parser = _TelegramHTMLSanitizer(keep_whitespace)
     parser.feed(text)
     parser.close()
     return parser.tokens
 
 
+def _telegram_html_to_tokens(text: str) -> list[_HtmlToken]:
+    return _sanitize_html(text, keep_whitespace=True)
+
+
+_PARSERS: dict[str, Callable[[str], list[_HtmlToken]]] = {
+    "markdown": _markdown_to_tokens,
+    "html": _telegram_html_to_tokens,
+    "plain": _plain_to_tokens,
+}
+
+
 def _escape_text(text: str) -> str:
     escaped = (
         text.replace("&", "&amp;")
@@ -208,80 +509,116 @@ def _render_start_tag(token: _HtmlToken) -> str:
     return f"<{tag}>"
 
 
-def _split_tokens(tokens: list[_HtmlToken], max_length: int) -> list[str]:
-    if max_length <= 0:
-        return [
-            _render_tokens(tokens, _collect_open_tags(tokens)),
-        ]
+def _split_tokens(tokens: list[_HtmlToken], max_length: Limits) -> list[str]:
+    return [_render_tokens(part, open_tags) for part, open_tags in _plan_parts(tokens, max_length)]
 
-    parts: list[str] = []
+
+def _measure_tokens(tokens: list[_HtmlToken], max_length: Limits) -> list[PartMeasure]:
+    return [_measure_part(part) for part, _ in _plan_parts(tokens, max_length)]
+
+
+def _measure_part(tokens: list[_HtmlToken]) -> PartMeasure:
+    length = 0
+    entities: dict[str, int] = {}
+    for token in tokens:
+        if token.kind == "text" and token.text is not None:
+            length += len(token.text)
+        elif token.kind == "start" and token.tag:
+            entities[token.tag] = entities.get(token.tag, 0) + 1
+    return PartMeasure(length=length, entities=entities)
+
+
+def _plan_parts(tokens: list[_HtmlToken], max_length: Limits) -> list[tuple[list[_HtmlToken], list[_HtmlToken]]]:
+    limits = (max_length,) if isinstance(max_length, int) else tuple(max_length)
+    if not limits:
+        raise ValueError("At least one part limit is required")
+    if len(limits) == 1 and limits[0] <= 0:
+        return [(tokens, _collect_open_tags(tokens))]
+
+    parts: list[tuple[list[_HtmlToken], list[_HtmlToken]]] = []
     current: list[_HtmlToken] = []
     open_tags: list[_HtmlToken] = []
     current_len = 0
+    pre_depth = 0
+    pre_block_lengths = _measure_pre_block_lengths(tokens)
+    limit = _part_limit(limits, 0)
 
     for index, token in enumerate(tokens):
         if token.kind == "start" and token.tag:
             if token.tag == "pre":
-                block_len = _measure_pre_block_length(tokens, index)
-                remaining = max_length - current_len
+                block_len = pre_block_lengths.get(index)
+                remaining = limit - current_len
                 if (
                     block_len is not None
-                    and block_len <= max_length
+                    and block_len <= _part_limit(limits, len(parts) + 1)
                     and current_len > 0
                     and block_len > remaining
                 ):
-                    parts.append(_render_tokens(current, open_tags))
+                    parts.append((current, list(open_tags)))
                     current = _reopen_tags(open_tags)
                     current_len = 0
+                    limit = _part_limit(limits, len(parts))
+                pre_depth += 1
             current.append(token)
             open_tags.append(token)
             continue
         if token.kind == "end" and token.tag:
             if open_tags and open_tags[-1].tag == token.tag:
+                if token.tag == "pre":
+                    pre_depth -= 1
                 open_tags.pop()
                 current.append(token)
             continue
         if token.kind == "text" and token.text is not None:
             text = token.text
-            while text:
-                remaining = max_length - current_len
+            offset = 0
+            in_code_block = pre_depth > 0
+            while offset < len(text):
+                remaining = limit - current_len
                 if remaining <= 0:
-                    parts.append(_render_tokens(current, open_tags))
+                    parts.append((current, list(open_tags)))
                     current = _reopen_tags(open_tags)
                     current_len = 0
+                    limit = _part_limit(limits, len(parts))
                     continue
 
-                if len(text) <= remaining:
-                    current.append(_HtmlToken(kind="text", text=text))
-                    current_len += len(text)
-                    text = ""
+                if len(text) - offset <= remaining:
+                    current.append(_HtmlToken(kind="text", text=text[offset:] if offset else text))
+                    current_len += len(text) - offset
+                    offset = len(text)
                     continue
 
-                in_code_block = any(tag.tag == "pre" for tag in open_tags)
-                split_at = _find_split_position(text, remaining, in_code_block)
-                current.append(_HtmlToken(kind="text", text=text[:split_at]))
-                current_len += len(text[:split_at])
-                parts.append(_render_tokens(current, open_tags))
+                split_at = _find_split_position(text, offset, remaining, in_code_block)
+                current.append(_HtmlToken(kind="text", text=text[offset:split_at]))
+                current_len += split_at - offset
+                parts.append((current, list(open_tags)))
                 current = _reopen_tags(open_tags)
                 current_len = 0
-                text = text[split_at:]
+                limit = _part_limit(limits, len(parts))
+                offset = split_at
 
     if current:
-        parts.append(_render_tokens(current, open_tags))
+        parts.append((current, open_tags))
 
     return parts
 
 
-def _find_split_position(text: str, limit: int, prefer_newline: bool) -> int:
+def _part_limit(limits: tuple[int, ...], index: int) -> int:
+    limit = limits[min(index, len(limits) - 1)]
+    return limit if limit > 0 else sys.maxsize
+
+
+def _find_split_position(text: str, start: int, limit: int, prefer_newline: bool) -> int:
+    end = start + limit
     if prefer_newline:
-        split_at = text.rfind("\n", 0, limit)
-        if split_at <= 0:
-            return limit
+        split_at = text.rfind("\n", start, end)
+        if split_at <= start:
+            return end
         return split_at + 1
 
-    split_at = max(text.rfind("\n", 0, limit), text.rfind(" ", 0, limit))
-    if split_at <= 0:
-        return limit
+    split_at = max(text.rfind("\n", start, end), text.rfind(" ", start, end))
+    if split_at <= start:
+        return end
     return split_at + 1
 
 
@@ -303,11 +640,11 @@ def _collect_open_tags(tokens: list[_HtmlToken]) -> list[_HtmlToken]:
     return stack
 
 
-def _unique_placeholder(source: str) -> str:
+def _unique_placeholder_nonce(source: str) -> str:
     while True:
-        placeholder = f"TGPHTOKEN{uuid.uuid4().hex}X"
-        if placeholder not in source:
-            return placeholder
+        nonce = uuid.uuid4().hex
+        if f"TGPHTOKEN{nonce}N" not in source:
+            return nonce
 
 
 def _trim_trailing_newlines(tokens: list[_HtmlToken]) -> list[_HtmlToken]:
@@ -326,34 +663,100 @@ def _trim_trailing_newlines(tokens: list[_HtmlToken]) -> list[_HtmlToken]:
     return tokens
 
 
-def _measure_pre_block_length(tokens: list[_HtmlToken], start_index: int) -> int | None:
-    token = tokens[start_index]
-    if token.kind != "start" or token.tag != "pre":
-        return None
+def _compact_tokens(tokens: list[_HtmlToken], collapse_blank_lines: bool = True) -> list[_HtmlToken]:
+    compacted: list[_HtmlToken] = []
+    open_tags: list[_HtmlToken] = []
+    closed_tags: list[_HtmlToken] = []
 
-    depth = 0
-    length = 0
-    for current in tokens[start_index:]:
-        if current.kind == "start" and current.tag == "pre":
-            depth += 1
+    for token in tokens:
+        if token.kind == "start" and token.tag:
+            previous = closed_tags[-1] if closed_tags else None
+            if (
+                previous is not None
+                and token.tag in _MERGEABLE_TAGS
+                and previous.tag == token.tag
+                and (previous.attrs or {}) == (token.attrs or {})
+            ):
+                compacted.pop()
+                closed_tags.pop()
+                open_tags.append(previous)
+                continue
+            compacted.append(token)
+            open_tags.append(token)
+            closed_tags.clear()
+            continue
+        if token.kind == "end" and token.tag:
+            if not open_tags or open_tags[-1].tag != token.tag:
+                continue
+            opened = open_tags.pop()
+            if compacted and compacted[-1] is opened:
+                compacted.pop()
+                closed_tags.clear()
+                continue
+            compacted.append(token)
+            closed_tags.append(opened)
             continue
-        if current.kind == "end" and current.tag == "pre":
-            depth -= 1
-            if depth == 0:
-                return length
+        if token.kind == "text" and token.text:
+            closed_tags.clear()
+            previous_text = compacted[-1] if compacted else None
+            if previous_text is not None and previous_text.kind == "text" and previous_text.text is not None:
+                compacted[-1] = _HtmlToken(kind="text", text=previous_text.text + token.text)
+                continue
+            compacted.append(token)
+
+    if not collapse_blank_lines:
+        return compacted
+    return _collapse_blank_lines(compacted)
+
+
+def _collapse_blank_lines(tokens: list[_HtmlToken]) -> list[_HtmlToken]:
+    preformatted_depth = 0
+    for index, token in enumerate(tokens):
+        if token.tag in _PREFORMATTED_TAGS:
+            if token.kind == "start":
+                preformatted_depth += 1
+            elif token.kind == "end":
+                preformatted_depth -= 1
             continue
-        if current.kind == "text" and current.text is not None:
-            length += len(current.text)
-    return None
+        if token.kind == "text" and token.text and preformatted_depth == 0 and "\n\n\n" in token.text:
+            tokens[index] = _HtmlToken(kind="text", text=_BLANK_LINES_RE.sub("\n\n", token.text))
+    return tokens
+
+
+def _measure_pre_block_lengths(tokens: list[_HtmlToken]) -> dict[int, int]:
+    lengths: dict[int, int] = {}
+    open_blocks: list[tuple[int, int]] = []
+    text_length = 0
+    for index, token in enumerate(tokens):
+        if token.kind == "start" and token.tag == "pre":
+            open_blocks.append((index, text_length))
+            continue
+        if token.kind == "end" and token.tag == "pre":
+            if open_blocks:
+                start_index, start_length = open_blocks.pop()
+                lengths[start_index] = text_length - start_length
+            continue
+        if token.kind == "text" and token.text is not None:
+            text_length += len(token.text)
+    return lengths
 
 
 class _TelegramHTMLSanitizer(HTMLParser):
-    def __init__(self) -> None:
+    def __init__(self, keep_whitespace: bool = False) -> None:
         super().__init__(convert_charrefs=False)
+        # Rendered Markdown separates blocks with newlines that carry no meaning; in Telegram HTML
+        # written by hand every newline between tags is a line break.
+        self._keep_whitespace = keep_whitespace
         self.tokens: list[_HtmlToken] = []
         self._open_tags: list[_HtmlToken] = []
         self._list_stack: list[dict[str, int | str]] = []
         self._blockquote_depth = 0
+        self._preformatted_depth = 0
+        self._pending_text: list[str] = []
+
+    def close(self) -> None:
+        super().close()
+        self._flush_text()
 
     def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
         tag = tag.lower()
@@ -541,7 +944,7 @@ class _TelegramHTMLSanitizer(HTMLParser):
         list_ctx = self._list_stack[-1]
         list_ctx["index"] = int(list_ctx["index"]) + 1
 
-        if self.tokens and not self._endswith_newline():
+        if self._has_output() and not self._endswith_newline():
             self._append_text("\n")
 
         if list_ctx["type"] == "ol":
@@ -571,8 +974,10 @@ class _TelegramHTMLSanitizer(HTMLParser):
 
     def _open_tag(self, tag: str, attrs: dict[str, str]) -> None:
         token = _HtmlToken(kind="start", tag=tag, attrs=attrs)
-        self.tokens.append(token)
+        self._append_token(token)
         self._open_tags.append(token)
+        if tag in _PREFORMATTED_TAGS:
+            self._preformatted_depth += 1
 
     def _close_tag(self, tag: str) -> None:
         if not self._open_tags:
@@ -580,18 +985,37 @@ class _TelegramHTMLSanitizer(HTMLParser):
         if self._open_tags[-1].tag != tag:
             return
         self._open_tags.pop()
-        self.tokens.append(_HtmlToken(kind="end", tag=tag))
+        if tag in _PREFORMATTED_TAGS:
+            self._preformatted_depth -= 1
+        self._append_token(_HtmlToken(kind="end", tag=tag))
+
+    def _append_token(self, token: _HtmlToken) -> None:
+        self._flush_text()
+        self.tokens.append(token)
 
     def _append_text(self, text: str) -> None:
         if text == "":
             return
+        self._pending_text.append(text)
+
+    def _flush_text(self) -> None:
+        if not self._pending_text:
+            return
+        text = "".join(self._pending_text)
+        self._pending_text.clear()
         if self.tokens and self.tokens[-1].kind == "text" and self.tokens[-1].text is not None:
-            merged = self.tokens[-1].text + text
-            self.tokens[-1] = _HtmlToken(kind="text", text=merged)
+            self.tokens[-1] = _HtmlToken(kind="text", text=self.tokens[-1].text + text)
             return
         self.tokens.append(_HtmlToken(kind="text", text=text))
 
+    def _has_output(self) -> bool:
+        return bool(self.tokens or self._pending_text)
+
     def _ensure_block_break(self) -> None:
+        if self._pending_text:
+            if not self._pending_text[-1].endswith("\n"):
+                self._append_text("\n")
+            return
         if not self.tokens:
             return
         last = self.tokens[-1]
@@ -601,13 +1025,24 @@ class _TelegramHTMLSanitizer(HTMLParser):
             self._append_text("\n")
 
     def _endswith_newline(self) -> bool:
+        if self._pending_text:
+            return self._pending_text[-1].endswith("\n")
         if not self.tokens:
             return False
         last = self.tokens[-1]
         return last.kind == "text" and last.text is not None and last.text.endswith("\n")
 
+    def at_block_boundary(self) -> bool:
+        return (
+            not self._open_tags
+            and not self._list_stack
+            and self._blockquote_depth == 0
+            and not self.rawdata
+            and self.cdata_elem is None
+        )
+
     def _preserve_whitespace(self) -> bool:
-        return any(tag.tag in {"pre", "code"} for tag in self._open_tags)
+        return self._keep_whitespace or self._preformatted_depth > 0
 
 
 def _is_allowed_href(href: str) -> bool:
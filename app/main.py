@@ -1,22 +1,56 @@
 import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
 import logging
+import os
+import socket
+import stat
+import time
+from typing import Any
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from uvicorn.config import Config
 from uvicorn.server import Server
 
+from api.dependencies import get_job_manager
 from api.router import router
+from api.warmup import ReadinessState, readiness, warm_up
 from config.config import settings
 from config.logger import configure_logger
+from domain.services.memory_profiler import memory_profiler
+from domain.services.telegram_formatter import block_cache
 
 
 configure_logger()
+block_cache.resize(settings.FORMAT_BLOCK_CACHE_MAX_BYTES)
+memory_profiler.configure(settings.MEMORY_PROFILE_SAMPLE_RATE, settings.MEMORY_PROFILE_TOP_SITES)
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    started = time.monotonic()
+    readiness.reset()
+    warmup: asyncio.Task[None] | None = None
+    if settings.WARMUP_ENABLED:
+        jobs = get_job_manager() if settings.WARMUP_JOB_WORKERS else None
+        warmup = asyncio.create_task(warm_up(jobs, settings.JOBS_WORKERS, started))
+    else:
+        readiness.state = ReadinessState.READY
+        readiness.startup_seconds = round(time.monotonic() - started, 3)
+    yield
+    if warmup is not None:
+        warmup.cancel()
+        with suppress(asyncio.CancelledError):
+            await warmup
+    await get_job_manager().close()
+
+
 app = FastAPI(
     root_path=settings.API_ROOT_PATH,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -39,16 +73,66 @@ async def log_request_response(request: Request, call_next):
 app.include_router(router)
 
 
-async def run_fastapi() -> None:
-    config = Config(app=app, host="0.0.0.0", port=9000, lifespan="on", log_level="warning")
-    server = Server(config)
-    await server.serve()
+def _server_config(**listener: Any) -> Config:
+    return Config(
+        app=app,
+        lifespan="on",
+        log_level="warning",
+        timeout_keep_alive=settings.SERVER_KEEP_ALIVE_TIMEOUT,
+        backlog=settings.SERVER_BACKLOG,
+        limit_concurrency=settings.SERVER_LIMIT_CONCURRENCY,
+        **listener,
+    )
+
+
+def build_server_configs() -> list[Config]:
+    configs: list[Config] = []
+    if settings.SERVER_TCP_ENABLED:
+        configs.append(_server_config(host=settings.SERVER_HOST, port=settings.SERVER_PORT))
+    if settings.SERVER_UDS_PATH:
+        configs.append(_server_config(uds=settings.SERVER_UDS_PATH))
+    if not configs:
+        raise RuntimeError("No listeners configured: enable SERVER_TCP_ENABLED or set SERVER_UDS_PATH")
+    return configs
+
+
+def bind_listener_sockets(configs: list[Config]) -> list[socket.socket]:
+    sockets: list[socket.socket] = []
+    for config in configs:
+        if config.uds:
+            _remove_stale_socket(config.uds)
+        sockets.append(config.bind_socket())
+    return sockets
+
+
+def _remove_stale_socket(path: str) -> None:
+    # Only a socket nobody listens on is stale; a live one belongs to another running instance.
+    with suppress(FileNotFoundError):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.remove(path)
+                return
+        raise RuntimeError(f"Unix socket {path} is in use by another process")
+
+
+async def run_fastapi(configs: list[Config]) -> None:
+    # One server for all listeners, so the app lifespan (warm-up, job pool shutdown) runs exactly once.
+    sockets = bind_listener_sockets(configs)
+    try:
+        await Server(configs[0]).serve(sockets=sockets)
+    finally:
+        for config in configs:
+            if config.uds:
+                with suppress(FileNotFoundError):
+                    os.remove(config.uds)
 
 
 async def main() -> None:
-    await asyncio.gather(
-        run_fastapi(),
-    )
+    await run_fastapi(build_server_configs())
 
 
 if __name__ == "__main__":
@@ -3,7 +3,21 @@ from __future__ import annotations
 from pathlib import Path
 import sys
 
+import pytest
+
 
 APP_ROOT = Path(__file__).resolve().parents[1]
 if str(APP_ROOT) not in sys.path:
     sys.path.insert(0, str(APP_ROOT))
+
+
+@pytest.fixture
+def enabled_block_cache():
+    from domain.services.telegram_formatter import block_cache
+
+    max_bytes = block_cache.stats().max_bytes
+    block_cache.resize(8 * 1024 * 1024)
+    block_cache.clear()
+    yield block_cache
+    block_cache.resize(max_bytes)
+    block_cache.clear()
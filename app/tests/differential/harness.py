@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from functools import partial
+import hashlib
+from pathlib import Path
+import random
+import time
+
+from domain.services import telegram_formatter
+from domain.services.block_cache import BlockCache
+from domain.services.telegram_formatter import (
+    _estimate_fragment_size,
+    _format_profiled,
+    format_markdown_for_telegram,
+)
+from tests.differential.reference import reference_format
+
+
+Formatter = Callable[[str, int], list[str]]
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+MAX_LENGTHS = (4096, 64, 7)
+
+
+# The block cache is off by default; the harness measures it with its own instance. The cold candidate runs
+# first and leaves the fragments of each sample in the cache, so the warm candidate after it only hits.
+_HARNESS_BLOCK_CACHE = BlockCache(8 * 1024 * 1024, _estimate_fragment_size)
+
+
+def _format_with_block_cache(text: str, max_length: int, *, cold: bool) -> list[str]:
+    if cold:
+        _HARNESS_BLOCK_CACHE.clear()
+    previous = telegram_formatter.block_cache
+    telegram_formatter.block_cache = _HARNESS_BLOCK_CACHE
+    try:
+        return format_markdown_for_telegram(text, max_length)
+    finally:
+        telegram_formatter.block_cache = previous
+
+
+CANDIDATES: dict[str, Formatter] = {
+    "format_markdown_for_telegram": format_markdown_for_telegram,
+    "format_markdown_for_telegram[cold block cache]": partial(_format_with_block_cache, cold=True),
+    "format_markdown_for_telegram[warm block cache]": partial(_format_with_block_cache, cold=False),
+    "format_markdown_for_telegram[memory_profile]": partial(_format_profiled, top_sites=0),
+}
+
+
+@dataclass(frozen=True)
+class Sample:
+    category: str
+    name: str
+    text: str
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    candidate: str
+    sample: Sample
+    max_length: int
+    reproducer: str
+    expected: list[str]
+    actual: list[str] | str
+
+
+@dataclass
+class CategoryTiming:
+    reference: float = 0.0
+    candidates: dict[str, float] = field(default_factory=dict)
+
+    def speedup(self, candidate: str) -> float:
+        elapsed = self.candidates.get(candidate, 0.0)
+        if elapsed <= 0:
+            return float("inf")
+        return self.reference / elapsed
+
+
+@dataclass
+class Report:
+    mismatches: list[Mismatch] = field(default_factory=list)
+    timings: dict[str, CategoryTiming] = field(default_factory=dict)
+    samples: int = 0
+
+
+def load_recorded_corpus(root: Path = CORPUS_DIR) -> list[Sample]:
+    samples: list[Sample] = []
+    for path in sorted(root.rglob("*.md")):
+        category = path.parent.relative_to(root).as_posix()
+        samples.append(Sample(category=category, name=path.name, text=path.read_text(encoding="utf-8")))
+    return samples
+
+
+_FRAGMENTS: dict[str, list[str]] = {
+    "prose": [
+        "Привет! Это обычное сообщение без разметки.",
+        "Second paragraph with punctuation, numbers 1234 and a long-ish sentence to split.",
+        "Строка с & амперсандом, <угловыми> скобками и \"кавычками\".",
+        "line one\nline two\nline three",
+    ],
+    "markdown": [
+        "# Заголовок",
+        "Text with **bold**, *italic*, ~~strike~~ and `code`.",
+        "[link](https://example.com/path?q=1) and ![🙂](tg://emoji?id=42)",
+        "||spoiler|| and ||another spoiler||",
+        "**bold *nested italic* bold**",
+        "Setext heading\n===",
+        "a  \nhard break",
+    ],
+    "code": [
+        "```python\ndef f(x):\n    return x * 2\n```",
+        "```\nplain\n\n\nblock\n```",
+        "    indented code\n    second line",
+        "`inline ```fence``` inside`",
+        "~~~\ntilde fence\n~~~",
+    ],
+    "json": [
+        '{"user": {"id": 1, "tags": ["a", "b"]}, "ok": true}',
+        "prefix [1, 2, 3] suffix",
+        '{"broken": [1, 2',
+        "[[[[",
+    ],
+    "structure": [
+        "- one\n- two\n  - nested\n  - nested 2\n- three",
+        "1. first\n\n2. second\n\n   continued",
+        "> quote\n> - list in quote\n>\n> para",
+        "<blockquote expandable>hidden\ntext</blockquote>",
+        "---",
+    ],
+    "html": [
+        "<b>bold</b><b>again</b>",
+        "<u>under <i>mixed</u></i>",
+        "<div>\n\nblock html\n</div>",
+        "<!-- comment",
+        "<span class=\"tg-spoiler\">span</span><tg-spoiler>tag</tg-spoiler>",
+        "<a href=\"javascript:alert(1)\">bad</a>",
+        "&amp; &lt; &#128512; &unknown;",
+    ],
+    "indented_html": [
+        "  <blockquote>indented quote</blockquote>",
+        " <pre>raw pre</pre>",
+        "   <b>bold</b> tail",
+        "  <div>\nblock\n</div>",
+        " <v>",
+        "  <!-- comment -->",
+        "text\n  <i>after line</i>",
+    ],
+}
+
+
+def generate_corpus(seed: int, per_category: int, max_fragments: int = 8) -> list[Sample]:
+    rng = random.Random(seed)
+    categories = list(_FRAGMENTS)
+    samples: list[Sample] = []
+    everything = [fragment for name in categories for fragment in _FRAGMENTS[name]]
+    for category in [*categories, "mixed"]:
+        pool = everything if category == "mixed" else _FRAGMENTS[category]
+        for index in range(per_category):
+            count = rng.randint(1, max_fragments)
+            separators = ("\n\n", "\n", " ", "")
+            text = "".join(rng.choice(pool) + rng.choice(separators) for _ in range(count))
+            samples.append(Sample(category=f"generated/{category}", name=f"{seed}-{index}", text=text))
+    return samples
+
+
+def shrink(text: str, failing: Callable[[str], bool]) -> str:
+    for split in (_split_lines, _split_chars):
+        text = _shrink_units(split(text), failing)
+    return text
+
+
+def _split_lines(text: str) -> list[str]:
+    return text.splitlines(keepends=True)
+
+
+def _split_chars(text: str) -> list[str]:
+    return list(text)
+
+
+def _shrink_units(units: list[str], failing: Callable[[str], bool]) -> str:
+    chunk = max(1, len(units) // 2)
+    while chunk >= 1:
+        index = 0
+        removed = False
+        while index < len(units):
+            candidate = units[:index] + units[index + chunk :]
+            if candidate and failing("".join(candidate)):
+                units = candidate
+                removed = True
+                continue
+            index += chunk
+        if not removed:
+            chunk //= 2
+    return "".join(units)
+
+
+def run(samples: list[Sample], candidates: dict[str, Formatter] | None = None) -> Report:
+    candidates = CANDIDATES if candidates is None else candidates
+    report = Report(samples=len(samples))
+
+    for sample in samples:
+        timing = report.timings.setdefault(sample.category, CategoryTiming())
+        for max_length in MAX_LENGTHS:
+            started = time.perf_counter()
+            expected = reference_format(sample.text, max_length)
+            timing.reference += time.perf_counter() - started
+
+            for name, candidate in candidates.items():
+                started = time.perf_counter()
+                actual = _safe_call(candidate, sample.text, max_length)
+                timing.candidates[name] = timing.candidates.get(name, 0.0) + time.perf_counter() - started
+                if actual != expected:
+                    reproducer = shrink(sample.text, _differs(candidate, max_length))
+                    report.mismatches.append(
+                        Mismatch(
+                            candidate=name,
+                            sample=sample,
+                            max_length=max_length,
+                            reproducer=reproducer,
+                            expected=reference_format(reproducer, max_length),
+                            actual=_safe_call(candidate, reproducer, max_length),
+                        )
+                    )
+    return report
+
+
+def record_reproducers(report: Report, root: Path = CORPUS_DIR) -> list[Path]:
+    target = root / "regressions"
+    target.mkdir(parents=True, exist_ok=True)
+    written: list[Path] = []
+    for mismatch in report.mismatches:
+        digest = hashlib.sha1(mismatch.reproducer.encode("utf-8", "surrogatepass")).hexdigest()[:12]
+        path = target / f"{digest}.md"
+        path.write_text(mismatch.reproducer, encoding="utf-8")
+        written.append(path)
+    return written
+
+
+def format_report(report: Report) -> Iterator[str]:
+    yield f"samples: {report.samples}, mismatches: {len(report.mismatches)}"
+    for category, timing in sorted(report.timings.items()):
+        speedups = ", ".join(f"{name} x{timing.speedup(name):.2f}" for name in sorted(timing.candidates))
+        yield f"  {category}: reference {timing.reference * 1000:.1f} ms; {speedups}"
+    for mismatch in report.mismatches:
+        yield (
+            f"MISMATCH {mismatch.candidate} [{mismatch.sample.category}/{mismatch.sample.name}] "
+            f"max_length={mismatch.max_length}: {mismatch.reproducer!r}"
+        )
+        yield f"  expected: {mismatch.expected!r}"
+        yield f"  actual:   {mismatch.actual!r}"
+
+
+def _differs(candidate: Formatter, max_length: int) -> Callable[[str], bool]:
+    def check(text: str) -> bool:
+        return _safe_call(candidate, text, max_length) != reference_format(text, max_length)
+
+    return check
+
+
+def _safe_call(formatter: Formatter, text: str, max_length: int) -> list[str] | str:
+    try:
+        return formatter(text, max_length)
+    except Exception as exc:
+        return f"{type(exc).__name__}: {exc}"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.differential.harness",
+        description="Сравнение быстрых путей форматтера с эталонной реализацией.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора корпуса")
+    parser.add_argument("--per-category", type=int, default=200, help="Число сгенерированных текстов на категорию")
+    parser.add_argument("--record", action="store_true", help="Сохранить минимальные репродукторы в корпус")
+    args = parser.parse_args(argv)
+
+    samples = load_recorded_corpus() + generate_corpus(args.seed, args.per_category)
+    report = run(samples)
+    for line in format_report(report):
+        print(line)
+    if args.record:
+        for path in record_reproducers(report):
+            print(f"recorded {path}")
+    return 1 if report.mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,37 @@
+from tests.differential.harness import (
+    Sample,
+    generate_corpus,
+    load_recorded_corpus,
+    reference_format,
+    run,
+    shrink,
+)
+
+
+def test_fast_paths_match_reference_on_corpus():
+    samples = load_recorded_corpus() + generate_corpus(seed=0, per_category=30)
+    report = run(samples)
+
+    assert report.samples == len(samples) > 0
+    assert report.mismatches == []
+    assert all(timing.candidates for timing in report.timings.values())
+
+
+def test_shrink_finds_minimal_reproducer():
+    text = "first line\nsecond *line* with noise\nthird line\n"
+    assert shrink(text, lambda candidate: "*" in candidate) == "*"
+
+
+def test_mismatch_is_reported_with_shrunk_reproducer():
+    def broken(text: str, max_length: int) -> list[str]:
+        parts = reference_format(text, max_length)
+        return [part.replace("<i>", "<b>") for part in parts]
+
+    sample = Sample(category="manual", name="italic", text="# Title\n\nplain text\n\nsome *italic* words\n")
+    report = run([sample], {"broken": broken})
+
+    assert report.mismatches
+    mismatch = report.mismatches[0]
+    assert mismatch.candidate == "broken"
+    assert len(mismatch.reproducer) < len(mismatch.sample.text)
+    assert "<i>" in "".join(mismatch.expected)
@@ -18,7 +18,10 @@ def _join_root_path(root_path: str, path: str) -> str:
 
 
 @pytest.fixture
-async def app():
+async def app(monkeypatch):
+    # The warm-up task would keep formatting in a worker thread during the test (it runs on the fixture's
+    # event loop, not the test's) and disturb profiling and admission tests; test_readiness.py covers it.
+    monkeypatch.setattr(settings, "WARMUP_ENABLED", False)
     async with LifespanManager(actual_app):
         yield actual_app
 
@@ -0,0 +1,22 @@
+from httpx import AsyncClient
+import pytest
+
+from api.admission import AdmissionController
+from api.dependencies import get_admission_controller
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_overloaded_format_request_is_rejected(app, client: AsyncClient, api_url):
+    controller = AdmissionController(max_inflight_cost=10, max_queued_cost=0, queue_timeout=1.0, retry_after=3)
+    app.dependency_overrides[get_admission_controller] = lambda: controller
+    try:
+        async with controller.admit(10):
+            response = await client.post(api_url("/v1/format"), json={"text": "busy"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+
+        response = await client.post(api_url("/v1/format"), json={"text": "free"})
+        assert response.json() == [{"text": "free"}]
+    finally:
+        app.dependency_overrides.pop(get_admission_controller, None)
@@ -41,3 +41,52 @@ async def test_format_endpoint(client: AsyncClient, api_url, text: str, expected
     response = await client.post(api_url("/v1/format"), json={"text": text})
     assert response.status_code == 200
     assert response.json() == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_measure_endpoint(client: AsyncClient, api_url):
+    response = await client.post(api_url("/v1/format/measure"), json={"text": "**a** " * 3000})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 2
+    assert [part["length"] for part in body["parts"]] == [4096, 1903]
+    # the bold run cut at the part boundary is reopened and counts in both parts
+    assert sum(part["entities"]["b"] for part in body["parts"]) == 3001
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_format_endpoint_with_part_limits(client: AsyncClient, api_url):
+    response = await client.post(api_url("/v1/format"), json={"text": "word " * 300, "limits": [100, 1000]})
+    assert [len(part["text"]) for part in response.json()] == [100, 1000, 399]
+
+    response = await client.post(api_url("/v1/format"), json={"text": "x", "limits": [0]})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_variants_endpoint(client: AsyncClient, api_url):
+    response = await client.post(
+        api_url("/v1/format/variants"),
+        json={"text": "**a** " * 1000, "profiles": {"caption": [1024, 4096], "message": [4096]}},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert list(body) == ["caption", "message"]
+    assert len(body["caption"]) == 2
+    assert len(body["message"]) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_format_endpoint_honours_stage_toggles(client: AsyncClient, api_url):
+    response = await client.post(api_url("/v1/format"), json={"text": "**x** ||s||", "input_format": "plain"})
+    assert response.json() == [{"text": "**x** ||s||"}]
+
+    response = await client.post(api_url("/v1/format"), json={"text": "**x** ||s||", "spoilers": False})
+    assert response.json() == [{"text": "<b>x</b> ||s||"}]
+
+    response = await client.post(api_url("/v1/format"), json={"text": "x", "input_format": "rtf"})
+    assert response.status_code == 422
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from httpx import AsyncClient
+import pytest
+
+from api.dependencies import get_job_manager
+from api.jobs import JobManager
+
+
+@pytest.fixture
+def job_manager(app):
+    manager = JobManager(
+        executor_factory=partial(ThreadPoolExecutor, max_workers=1),
+        max_pending=4,
+        max_stored_bytes=1024 * 1024,
+        result_ttl=60.0,
+        retry_after=1,
+        callback_timeout=1.0,
+    )
+    app.dependency_overrides[get_job_manager] = lambda: manager
+    yield manager
+    app.dependency_overrides.pop(get_job_manager, None)
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_format_job_can_be_long_polled(client: AsyncClient, api_url, job_manager: JobManager):
+    response = await client.post(api_url("/v1/format/jobs"), json={"text": "**big** job"})
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response.headers["Location"].endswith(api_url(f"/v1/format/jobs/{job_id}"))
+
+    response = await client.get(api_url(f"/v1/format/jobs/{job_id}"), params={"wait": 5})
+
+    assert response.json() == {"id": job_id, "status": "done", "parts": [{"text": "<b>big</b> job"}], "error": None}
+    metrics = await client.get(api_url("/v1/metrics"))
+    assert metrics.json()["jobs"]["completed"] == 1
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_unknown_format_job_is_not_found(client: AsyncClient, api_url, job_manager: JobManager):
+    response = await client.get(api_url("/v1/format/jobs/missing"))
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_remote_callback_url_is_rejected(client: AsyncClient, api_url, job_manager: JobManager):
+    response = await client.post(
+        api_url("/v1/format/jobs"),
+        json={"text": "text", "callback_url": "http://example.com/hook"},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_format_job_runs_in_worker_process(client: AsyncClient, api_url):
+    response = await client.post(api_url("/v1/format/jobs"), json={"text": "`code`"})
+    job_id = response.json()["id"]
+
+    response = await client.get(api_url(f"/v1/format/jobs/{job_id}"), params={"wait": 30})
+
+    assert response.json()["parts"] == [{"text": "<code>code</code>"}]
@@ -0,0 +1,36 @@
+from httpx import AsyncClient
+import pytest
+
+from domain.services.memory_profiler import memory_profiler
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_metrics_report_block_cache(client: AsyncClient, api_url, enabled_block_cache):
+    await client.post(api_url("/v1/format"), json={"text": "Hello\n\nfooter"})
+    await client.post(api_url("/v1/format"), json={"text": "Bye\n\nfooter"})
+
+    response = await client.get(api_url("/v1/metrics"))
+
+    assert response.status_code == 200
+    stats = response.json()["block_cache"]
+    assert stats["hits"] >= 1
+    assert 0 < stats["hit_rate"] <= 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_metrics_report_memory_profile_when_enabled(client: AsyncClient, api_url):
+    response = await client.get(api_url("/v1/metrics"))
+    assert "memory_profile" not in response.json()
+
+    memory_profiler.configure(1.0, top_sites=1)
+    try:
+        await client.post(api_url("/v1/format"), json={"text": "profiled **text**"})
+        response = await client.get(api_url("/v1/metrics"))
+    finally:
+        memory_profiler.configure(0.0)
+        memory_profiler.clear()
+
+    stages = response.json()["memory_profile"]["stages"]
+    assert stages["markdown"]["samples"] >= 1
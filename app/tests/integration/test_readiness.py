@@ -0,0 +1,54 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from asgi_lifespan import LifespanManager
+from httpx import ASGITransport, AsyncClient
+import pytest
+
+from config.config import settings
+from main import app
+
+
+@asynccontextmanager
+async def _started_client(monkeypatch, **overrides) -> AsyncIterator[AsyncClient]:
+    # The lifespan warm-up runs as a task on the loop that started the app, so start it inside the test.
+    monkeypatch.setattr(settings, "WARMUP_JOB_WORKERS", False)
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+    async with LifespanManager(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            yield client
+
+
+async def _wait_ready(client: AsyncClient, url: str) -> dict:
+    for _ in range(500):
+        response = await client.get(url)
+        if response.status_code == 200:
+            return response.json()
+        assert response.json()["status"] == "starting"
+        await asyncio.sleep(0.01)
+    raise AssertionError("service did not become ready")
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_readiness_reports_ready_after_warm_up(monkeypatch, api_url):
+    async with _started_client(monkeypatch) as client:
+        body = await _wait_ready(client, api_url("/v1/readiness"))
+        health = await client.get(api_url("/v1/healthcheck"))
+
+    assert body["status"] == "ready"
+    assert body["warmup_seconds"] > 0
+    assert body["startup_seconds"] >= body["warmup_seconds"]
+    assert health.json() == {"status": "ok"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_readiness_without_warm_up(monkeypatch, api_url):
+    async with _started_client(monkeypatch, WARMUP_ENABLED=False) as client:
+        response = await client.get(api_url("/v1/readiness"))
+
+    assert response.status_code == 200
+    assert response.json()["warmup_seconds"] is None
@@ -0,0 +1,66 @@
+import threading
+
+from httpx import AsyncClient
+import pytest
+
+from api.dependencies import get_result_cache
+from domain.services.result_cache import ResultCache
+
+
+@pytest.fixture
+def result_cache(app, tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite"), 1024 * 1024)
+    app.dependency_overrides[get_result_cache] = lambda: cache
+    yield cache
+    app.dependency_overrides.pop(get_result_cache, None)
+    cache.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_format_uses_shared_result_cache(client: AsyncClient, api_url, result_cache: ResultCache):
+    for _ in range(2):
+        response = await client.post(api_url("/v1/format"), json={"text": "**cached**"})
+        assert response.json() == [{"text": "<b>cached</b>"}]
+
+    stats = result_cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+
+    metrics = await client.get(api_url("/v1/metrics"))
+    assert metrics.json()["result_cache"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_result_cache_separates_request_options(client: AsyncClient, api_url, result_cache: ResultCache):
+    markdown = await client.post(api_url("/v1/format"), json={"text": "**cached**"})
+    plain = await client.post(api_url("/v1/format"), json={"text": "**cached**", "input_format": "plain"})
+    split = await client.post(api_url("/v1/format"), json={"text": "**cached**", "limits": [3, 4096]})
+
+    assert markdown.json() == [{"text": "<b>cached</b>"}]
+    assert plain.json() == [{"text": "**cached**"}]
+    assert split.json() == [{"text": "<b>cac</b>"}, {"text": "<b>hed</b>"}]
+    assert result_cache.stats().entries == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_result_cache_io_runs_off_the_event_loop(client: AsyncClient, api_url, result_cache: ResultCache):
+    event_loop_thread = threading.get_ident()
+    threads: list[int] = []
+
+    def record(method):
+        def wrapper(*args):
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        return wrapper
+
+    result_cache.get = record(result_cache.get)  # type: ignore[method-assign]
+    result_cache.put = record(result_cache.put)  # type: ignore[method-assign]
+
+    await client.post(api_url("/v1/format"), json={"text": "**cached**"})
+    await client.post(api_url("/v1/format/variants"), json={"text": "**cached**", "profiles": {"a": [3], "b": [9]}})
+
+    assert len(threads) == 6
+    assert event_loop_thread not in threads
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from api.admission import AdmissionController, AdmissionRejected, estimate_format_cost
+
+
+def _controller(**overrides) -> AdmissionController:
+    options = {"max_inflight_cost": 100, "max_queued_cost": 1000, "queue_timeout": 1.0, "retry_after": 2}
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def test_cost_grows_with_structure():
+    assert estimate_format_cost("a" * 10) < estimate_format_cost("`" * 10)
+    assert estimate_format_cost("") > 0
+
+
+@pytest.mark.asyncio
+async def test_small_requests_are_admitted_before_large_ones():
+    controller = _controller()
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def run(name: str, cost: int) -> None:
+        async with controller.admit(cost):
+            order.append(name)
+            if name == "first":
+                await release.wait()
+
+    first = asyncio.create_task(run("first", 100))
+    await asyncio.sleep(0)
+    large = asyncio.create_task(run("large", 90))
+    small = asyncio.create_task(run("small", 5))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, large, small)
+
+    assert order == ["first", "small", "large"]
+    assert controller.stats()["inflight_cost"] == 0
+
+
+@pytest.mark.asyncio
+async def test_oversized_request_runs_alone():
+    controller = _controller()
+    async with controller.admit(500):
+        assert controller.stats()["inflight_cost"] == 500
+
+
+@pytest.mark.asyncio
+async def test_excess_load_is_shed():
+    controller = _controller(max_queued_cost=10)
+    async with controller.admit(100):
+        with pytest.raises(AdmissionRejected) as exc_info:
+            async with controller.admit(50):
+                pass
+    assert exc_info.value.retry_after == 2
+    assert controller.stats()["shed"] == 1
+    assert controller.stats()["queued_cost"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_sheds_request():
+    controller = _controller(queue_timeout=0.01)
+    async with controller.admit(100):
+        with pytest.raises(AdmissionRejected):
+            async with controller.admit(5):
+                pass
+    async with controller.admit(5):
+        assert controller.stats()["inflight_cost"] == 5
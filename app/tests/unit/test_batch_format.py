@@ -0,0 +1,49 @@
+import io
+import json
+import subprocess
+import sys
+
+from cli.batch_format import _read_directory, _read_ndjson, main, run_batch
+from tests.conftest import APP_ROOT
+
+
+def _run(lines: list[str], workers: int) -> list[dict]:
+    output = io.StringIO()
+    records = _read_ndjson(io.StringIO("\n".join(lines)))
+    run_batch(records, output, max_length=4, workers=workers, chunksize=2)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_batch_keeps_input_order_across_processes():
+    lines = [json.dumps({"id": f"m{i}", "text": f"**msg {i}**"}) for i in range(25)]
+
+    results = _run(lines, workers=2)
+
+    assert [result["id"] for result in results] == [f"m{i}" for i in range(25)]
+    assert results[3]["parts"] == [{"text": "<b>msg </b>"}, {"text": "<b>3</b>"}]
+    assert results == _run(lines, workers=1)
+
+
+def test_batch_reports_invalid_lines():
+    results = _run(["not json", json.dumps({"text": 1}), json.dumps({"text": "ok"})], workers=1)
+
+    assert [result["id"] for result in results] == [1, 2, 3]
+    assert "error" in results[0] and "error" in results[1]
+    assert results[2]["parts"] == [{"text": "ok"}]
+
+
+def test_directory_input(tmp_path):
+    (tmp_path / "b.md").write_text("*b*", encoding="utf-8")
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "a.md").write_text("a", encoding="utf-8")
+    assert [record.id for record in _read_directory(tmp_path)] == ["b.md", "nested/a.md"]
+
+    output = tmp_path / "out.ndjson"
+    assert main([str(tmp_path / "nested"), "-o", str(output), "--workers", "1"]) == 0
+    assert json.loads(output.read_text(encoding="utf-8")) == {"id": "a.md", "parts": [{"text": "a"}]}
+
+
+def test_cli_does_not_import_web_stack():
+    code = "import sys, cli.batch_format; print(sorted({'fastapi', 'uvicorn', 'pydantic'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=APP_ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,81 @@
+from domain.services.block_cache import BlockCache
+from domain.services.telegram_formatter import (
+    _markdown_to_html,
+    _markdown_to_tokens_cached,
+    _sanitize_html,
+    format_markdown_for_telegram,
+)
+
+
+def test_cache_evicts_least_recently_used_by_size():
+    cache: BlockCache[str] = BlockCache(10, len)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.put("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    assert cache.stats().size_bytes == 8
+
+
+def test_cache_skips_values_larger_than_limit():
+    cache: BlockCache[str] = BlockCache(3, len)
+    cache.put("a", "aaaa")
+    assert cache.get("a") is None
+    assert cache.stats().entries == 0
+
+
+def test_cache_reports_hit_rate():
+    cache: BlockCache[str] = BlockCache(10, len)
+    cache.put("a", "a")
+    cache.get("a")
+    cache.get("b")
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.hit_rate) == (1, 1, 0.5)
+
+
+def test_shared_footer_is_served_from_cache(enabled_block_cache):
+    footer = "> Disclaimer: **not** financial advice.\n\n- [help](https://example.com/help)\n- `/stop`"
+    format_markdown_for_telegram(f"First message\n\n{footer}", 4096)
+    hits_before = enabled_block_cache.stats().hits
+
+    result = format_markdown_for_telegram(f"Second *message*\n\n{footer}", 4096)
+
+    assert enabled_block_cache.stats().hits >= hits_before + 2
+    assert result == [
+        "Second <i>message</i>\n<blockquote>Disclaimer: <b>not</b> financial advice.\n</blockquote>\n"
+        "• <a href=\"https://example.com/help\">help</a>\n• <code>/stop</code>"
+    ]
+
+
+def test_cached_tokens_match_full_render():
+    samples = [
+        "# Title\n\ntext *a*\n\n1. one\n\n2. two\n\n```py\ncode\n```\nafter",
+        "</b>\ntext\n===\n",
+        "<u>x</u>\n\n\n<blockquote expandable>m</blockquote>\n-->\n",
+        "```\nunclosed\n\n",
+        "> - q\n> - r\n\n  - nested\n    - deeper\n\n",
+    ]
+    for text in samples:
+        assert _markdown_to_tokens_cached(text) == _sanitize_html(_markdown_to_html(text))
+
+
+def test_reference_definitions_fall_back_to_full_render():
+    assert _markdown_to_tokens_cached("[a][x]\n\n[x]: https://example.com") is None
+
+
+def test_indented_html_block_after_another_block_falls_back_to_full_render():
+    assert _markdown_to_tokens_cached("Hello\n\n  <blockquote>q</blockquote>") is None
+    assert _markdown_to_tokens_cached("```\ncode\n```\n <pre>raw</pre>") is None
+    assert format_markdown_for_telegram("Hello\n\n  <blockquote>q</blockquote>", 0) == [
+        "Hello\n<blockquote>q</blockquote>"
+    ]
+    assert format_markdown_for_telegram("```\ncode\n```\n <pre>raw</pre>", 0) == [
+        "<pre><code>code\n</code></pre><pre>raw</pre>"
+    ]
+
+
+def test_indented_html_block_at_document_start_is_cached():
+    text = "  <b>first</b>\n\ntext"
+    assert _markdown_to_tokens_cached(text) == _sanitize_html(_markdown_to_html(text))
@@ -0,0 +1,104 @@
+from collections.abc import Callable
+import gc
+import math
+import time
+
+import pytest
+
+from domain.services.telegram_formatter import (
+    _format_json_blocks,
+    _markdown_to_html,
+    _replace_spoilers,
+    _sanitize_html,
+    _split_tokens,
+    format_markdown_for_telegram,
+)
+
+
+pytestmark = pytest.mark.complexity
+
+_SIZES = (1_000, 2_000, 4_000, 8_000)
+_REPEATS = 3
+_MIN_SAMPLE_SECONDS = 0.02
+_MAX_EXPONENT = 1.5
+
+
+def _best_time(run: Callable[[], object], loops: int) -> float:
+    best = math.inf
+    for _ in range(_REPEATS):
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        best = min(best, time.perf_counter() - started)
+    return max(best, 1e-9)
+
+
+def _calibrate_loops(run: Callable[[], object]) -> int:
+    loops = 1
+    while _best_time(run, loops) < _MIN_SAMPLE_SECONDS and loops < 1024:
+        loops *= 2
+    return loops
+
+
+def _scaling_exponent(make_input: Callable[[int], object], run: Callable[[object], object]) -> float:
+    xs: list[float] = []
+    ys: list[float] = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = 0
+        for size in _SIZES:
+            payload = make_input(size)
+            if not loops:
+                loops = _calibrate_loops(lambda: run(payload))
+            xs.append(math.log(size))
+            ys.append(math.log(_best_time(lambda: run(payload), loops)))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return covariance / variance
+
+
+def _format(text: str) -> list[str]:
+    return format_markdown_for_telegram(text, 4096)
+
+
+def _sanitize(text: str) -> object:
+    return _sanitize_html(_markdown_to_html(text))
+
+
+@pytest.mark.parametrize(
+    ("make_input", "run"),
+    [
+        pytest.param(lambda n: "||a " * n + "|", _replace_spoilers, id="spoiler-unmatched-pipes"),
+        pytest.param(lambda n: "```a\n" * n, _replace_spoilers, id="code-block-unbalanced-fences"),
+        pytest.param(lambda n: "`a` " * n, _replace_spoilers, id="inline-code-stash"),
+        pytest.param(lambda n: "`a ```x``` b` " * (n // 4), _format_json_blocks, id="nested-code-stash"),
+        pytest.param(lambda n: "[" * n, _format_json_blocks, id="json-bracket-flood"),
+        pytest.param(lambda n: '{"a":' * n, _format_json_blocks, id="json-brace-flood"),
+        pytest.param(lambda n: "[ ] " * n, _format_json_blocks, id="json-many-values"),
+        pytest.param(lambda n: "&amp;" * n, _sanitize, id="sanitizer-text-merging"),
+        pytest.param(lambda n: "<b>a</i>" * n, _sanitize, id="sanitizer-mismatched-tags"),
+        pytest.param(lambda n: "<b>x" * n, _format, id="deep-inline-html"),
+        pytest.param(lambda n: "- " * n + "x", _format, id="deep-list-nesting"),
+        pytest.param(lambda n: "> " * n + "x", _format, id="deep-blockquote-nesting"),
+        pytest.param(lambda n: "```\nx\n```\n" * n, _format, id="many-code-blocks"),
+        pytest.param(lambda n: "<!-- " + "a <b> " * n, _format, id="unclosed-html-comment"),
+    ],
+)
+def test_stage_scales_near_linearly(make_input, run):
+    exponent = _scaling_exponent(make_input, run)
+    assert exponent <= _MAX_EXPONENT, f"measured scaling exponent {exponent:.2f}"
+
+
+def test_split_scales_near_linearly_with_small_limit():
+    def make_input(n: int) -> object:
+        return _sanitize("word " * n)
+
+    exponent = _scaling_exponent(make_input, lambda tokens: _split_tokens(tokens, 8))
+    assert exponent <= _MAX_EXPONENT, f"measured scaling exponent {exponent:.2f}"
@@ -1,4 +1,13 @@
-from domain.services.telegram_formatter import format_markdown_for_telegram
+import html
+import re
+
+from domain.services.telegram_formatter import (
+    FormatOptions,
+    PartMeasure,
+    format_markdown_for_telegram,
+    format_markdown_variants,
+    measure_markdown_for_telegram,
+)
 
 
 def test_formatting_preserves_basic_markup():
@@ -27,6 +36,13 @@ def test_spoiler_formatting():
     assert result == ["Hello <span class=\"tg-spoiler\">secret</span>"]
 
 
+def test_placeholder_shaped_input_is_kept_verbatim():
+    text = "TGPHTOKEN" + "a" * 32 + "N0X ||s|| `c`"
+    assert format_markdown_for_telegram(text, 4096) == [
+        "TGPHTOKEN" + "a" * 32 + "N0X <span class=\"tg-spoiler\">s</span> <code>c</code>"
+    ]
+
+
 def test_split_preserves_tags():
     text = "**hello world**"
     result = format_markdown_for_telegram(text, 6)
@@ -67,3 +83,111 @@ def test_json_not_processed_inside_inline_code():
     text = "`{\"a\":1}`"
     result = format_markdown_for_telegram(text, 4096)
     assert result == ["<code>{&quot;a&quot;:1}</code>"]
+
+
+def test_adjacent_identical_tags_are_merged():
+    assert format_markdown_for_telegram("<b><i>a</i></b><b><i>b</i></b>", 4096) == ["<b><i>ab</i></b>"]
+    assert format_markdown_for_telegram("||a||||b||", 4096) == ["<span class=\"tg-spoiler\">ab</span>"]
+
+
+def test_adjacent_links_with_different_targets_are_kept():
+    text = "[a](https://a.example)[b](https://b.example)"
+    result = format_markdown_for_telegram(text, 4096)
+    assert result == ["<a href=\"https://a.example\">a</a><a href=\"https://b.example\">b</a>"]
+
+
+def test_empty_elements_are_dropped():
+    assert format_markdown_for_telegram("<b></b>x<i><u></u></i>", 4096) == ["x"]
+
+
+def test_blank_line_runs_collapsed_outside_code():
+    assert format_markdown_for_telegram("- a\n  - b\n- c\n\nx", 4096) == ["• a\n• b\n\n• c\n\nx"]
+    assert format_markdown_for_telegram("```\n\n\n\nx\n```", 4096) == ["<pre><code>\n\n\nx\n</code></pre>"]
+
+
+def test_bracket_flood_does_not_crash_json_detection():
+    text = "[" * 5000
+    assert "".join(format_markdown_for_telegram(text, 4096)) == text
+
+
+def test_code_block_inside_inline_code_is_restored():
+    result = format_markdown_for_telegram("`a ```x``` b`", 4096)
+    assert result == ["<code>a ```x``` b</code>"]
+
+
+def test_measure_matches_rendered_parts():
+    text = "# Title\n\n" + "Some **bold** and `code` text. " * 40 + "\n\n```python\n" + "x = 1\n" * 30 + "```"
+    for max_length in (4096, 100, 7):
+        parts = format_markdown_for_telegram(text, max_length)
+        measures = measure_markdown_for_telegram(text, max_length)
+        assert len(measures) == len(parts)
+        for part, measure in zip(parts, measures, strict=True):
+            assert measure.length == len(html.unescape(re.sub(r"<[^>]+>", "", part)))
+            assert sum(measure.entities.values()) == len(re.findall(r"<[a-z]", part))
+
+
+def test_measure_counts_entities_per_part():
+    assert measure_markdown_for_telegram("**a** *b* **c**", 4096) == [PartMeasure(length=5, entities={"b": 2, "i": 1})]
+    assert measure_markdown_for_telegram("   ", 4096) == []
+
+
+def test_per_part_limits_apply_in_order_and_last_repeats():
+    text = "word " * 60
+    parts = format_markdown_for_telegram(text, [20, 100])
+    assert [len(part) for part in parts] == [20, 100, 100, 79]
+    assert "".join(parts) == text.rstrip()
+    assert format_markdown_for_telegram(text, [100]) == format_markdown_for_telegram(text, 100)
+
+
+def test_code_block_moves_to_next_part_when_it_fits_the_next_limit():
+    text = "Caption text\n\n```\n" + "x\n" * 20 + "```"
+    parts = format_markdown_for_telegram(text, [30, 100])
+    assert parts == ["Caption text\n", "<pre><code>" + "x\n" * 20 + "</code></pre>"]
+
+
+def test_variants_share_one_parse(enabled_block_cache):
+    text = "# Title\n\n" + "Some **bold** text. " * 100
+    profiles = {"caption": [1024, 4096], "message": [4096], "tiny": [50]}
+    variants = format_markdown_variants(text, profiles)
+
+    assert enabled_block_cache.stats().misses == 2
+    assert variants == {name: format_markdown_for_telegram(text, limits) for name, limits in profiles.items()}
+    assert format_markdown_variants("  ", profiles) == {"caption": [], "message": [], "tiny": []}
+
+
+def test_json_and_spoiler_stages_can_be_disabled():
+    text = '||s|| {"a":1}'
+    assert format_markdown_for_telegram(text, 4096, FormatOptions(format_json=False, spoilers=False)) == [
+        "||s|| {&quot;a&quot;:1}"
+    ]
+    assert format_markdown_for_telegram(text, 4096, FormatOptions(format_json=False)) == [
+        '<span class="tg-spoiler">s</span> {&quot;a&quot;:1}'
+    ]
+
+
+def test_html_input_skips_markdown():
+    text = "**x** <b>y</b> <script>z</script> a < b\n\nline"
+    result = format_markdown_for_telegram(text, 4096, FormatOptions(input_format="html"))
+    assert result == ["**x** <b>y</b> &lt;script&gt;z&lt;/script&gt; a &lt; b\n\nline"]
+
+
+def test_html_input_keeps_line_breaks_between_tags():
+    text = '<b>Title</b>\n<i>subtitle</i>\n\n<a href="https://x.y">link</a>'
+    result = format_markdown_for_telegram(text, 100, FormatOptions(input_format="html"))
+    assert result == ['<b>Title</b>\n<i>subtitle</i>\n\n<a href="https://x.y">link</a>']
+
+
+def test_html_input_keeps_blank_lines_between_tags():
+    result = format_markdown_for_telegram("<b>a</b>\n\n\n\n<b>b</b>", 4096, FormatOptions(input_format="html"))
+    assert result == ["<b>a</b>\n\n\n\n<b>b</b>"]
+
+
+def test_plain_input_keeps_blank_lines():
+    result = format_markdown_for_telegram("a\n\n\n\n\nb\n\n", 4096, FormatOptions(input_format="plain"))
+    assert result == ["a\n\n\n\n\nb"]
+
+
+def test_plain_input_is_escaped_literally():
+    text = "**x** <b>y</b> ||s|| `c`\n"
+    result = format_markdown_for_telegram(text, 4096, FormatOptions(input_format="plain"))
+    assert result == ["**x** &lt;b&gt;y&lt;/b&gt; ||s|| `c`"]
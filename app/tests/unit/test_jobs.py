@@ -0,0 +1,204 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from api.jobs import JobManager, JobRejected, JobState, validate_callback_url
+from domain.services.result_cache import ResultCache
+from domain.services.telegram_formatter import format_markdown_for_telegram
+
+
+def _manager(**overrides) -> JobManager:
+    options = {
+        "executor_factory": partial(ThreadPoolExecutor, max_workers=1),
+        "max_pending": 4,
+        "max_stored_bytes": 1024,
+        "result_ttl": 60.0,
+        "retry_after": 2,
+        "callback_timeout": 1.0,
+    }
+    options.update(overrides)
+    return JobManager(**options)
+
+
+def _submit(manager: JobManager, text: str, callback_url: str | None = None):
+    return manager.submit(text, "test", partial(format_markdown_for_telegram, text, 4096), callback_url)
+
+
+@pytest.mark.unit
+async def test_job_completes_in_background():
+    manager = _manager()
+    job = _submit(manager, "**bold**")
+    assert job.state is JobState.PENDING
+
+    await manager.wait(job, 5.0)
+
+    assert job.state is JobState.DONE
+    assert job.parts == ["<b>bold</b>"]
+    assert manager.get(job.id) is job
+    assert manager.stats()["completed"] == 1
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_job_result_is_stored_in_and_served_from_result_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), 1024 * 1024)
+    manager = _manager(result_cache=cache)
+    first = _submit(manager, "**bold**")
+    await manager.wait(first, 5.0)
+
+    def unexpected() -> list[str]:
+        raise AssertionError("cached job must not be formatted again")
+
+    second = manager.submit("**bold**", "test", unexpected)
+    await manager.wait(second, 5.0)
+
+    assert second.parts == first.parts == ["<b>bold</b>"]
+    assert (cache.stats().hits, cache.stats().misses) == (1, 1)
+    await manager.close()
+    cache.close()
+
+
+@pytest.mark.unit
+async def test_failed_job_reports_error():
+    manager = _manager()
+
+    def explode() -> list[str]:
+        raise ValueError("boom")
+
+    job = manager.submit("text", "test", explode)
+    await manager.wait(job, 5.0)
+
+    assert job.state is JobState.FAILED
+    assert job.error == "ValueError: boom"
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_dead_worker_process_does_not_break_later_jobs():
+    manager = _manager(
+        executor_factory=partial(ProcessPoolExecutor, max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    )
+    crashed = manager.submit("crash", "test", partial(os._exit, 1))
+    await manager.wait(crashed, 30.0)
+
+    job = _submit(manager, "**after**")
+    await manager.wait(job, 30.0)
+
+    assert crashed.state is JobState.FAILED
+    assert crashed.error is not None and crashed.error.startswith("BrokenProcessPool")
+    assert job.state is JobState.DONE
+    assert job.parts == ["<b>after</b>"]
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_submit_is_rejected_when_queue_is_full():
+    release = threading.Event()
+    manager = _manager(max_pending=1)
+    first = manager.submit("slow", "test", lambda: [release.wait(5.0) and "slow"])
+
+    with pytest.raises(JobRejected) as exc_info:
+        _submit(manager, "second")
+    assert exc_info.value.retry_after == 2
+
+    release.set()
+    await manager.wait(first, 5.0)
+    assert first.parts == ["slow"]
+    assert manager.stats()["rejected"] == 1
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_oldest_results_are_evicted_to_stay_within_memory_budget():
+    manager = _manager(max_stored_bytes=100)
+    first = _submit(manager, "a" * 60)
+    await manager.wait(first, 5.0)
+
+    second = _submit(manager, "b" * 60)
+    await manager.wait(second, 5.0)
+
+    assert manager.get(first.id) is None
+    assert manager.get(second.id) is second
+    assert manager.stats()["stored_bytes"] == 60
+    assert manager.stats()["evicted"] == 1
+
+    with pytest.raises(JobRejected):
+        _submit(manager, "c" * 101)
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_results_expire_after_ttl():
+    manager = _manager(result_ttl=0.05)
+    job = _submit(manager, "short")
+    await manager.wait(job, 5.0)
+
+    await asyncio.sleep(0.1)
+
+    assert manager.get(job.id) is None
+    assert manager.stats()["expired"] == 1
+    assert manager.stats()["stored_bytes"] == 0
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_wait_returns_pending_job_after_timeout():
+    release = threading.Event()
+    manager = _manager()
+    job = manager.submit("slow", "test", lambda: [release.wait(5.0) and "slow"])
+
+    await manager.wait(job, 0.05)
+
+    assert job.state is JobState.PENDING
+    release.set()
+    await manager.wait(job, 5.0)
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_callback_receives_result():
+    received: list[dict] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    manager = _manager()
+    try:
+        job = _submit(manager, "*done*", f"http://127.0.0.1:{server.server_port}/hook")
+        await manager.wait(job, 5.0)
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await manager.close()
+        server.shutdown()
+        server.server_close()
+
+    assert received == [{"id": job.id, "status": "done", "parts": [{"text": "<i>done</i>"}], "error": None}]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "url",
+    ["http://example.com/hook", "ftp://localhost/hook", "http://10.0.0.1/hook", "localhost:8000/hook"],
+)
+def test_callback_url_must_be_local(url: str):
+    with pytest.raises(ValueError):
+        validate_callback_url(url)
@@ -0,0 +1,71 @@
+import tracemalloc
+
+import pytest
+
+from domain.services.memory_profiler import memory_profiler
+from domain.services.telegram_formatter import format_markdown_for_telegram, format_markdown_variants
+
+
+TEXT = "# Title\n\n" + "Some **bold** and `code` with {\"a\": [1, 2]} inside. " * 200
+
+
+@pytest.fixture
+def profiler():
+    memory_profiler.clear()
+    memory_profiler.configure(1.0, top_sites=3)
+    yield memory_profiler
+    memory_profiler.configure(0.0)
+    memory_profiler.clear()
+
+
+@pytest.mark.unit
+def test_disabled_profiler_records_nothing():
+    memory_profiler.clear()
+    assert not memory_profiler.enabled
+
+    format_markdown_for_telegram(TEXT, 4096)
+
+    assert memory_profiler.stats()["stages"] == {}
+    assert not tracemalloc.is_tracing()
+
+
+@pytest.mark.unit
+def test_profiled_request_records_each_stage(profiler, caplog):
+    expected = format_markdown_for_telegram(TEXT, 4096)
+    profiler.clear()
+
+    with caplog.at_level("INFO", logger="domain.services.memory_profiler"):
+        assert format_markdown_for_telegram(TEXT, 4096) == expected
+
+    stages = profiler.stats()["stages"]
+    assert list(stages) == ["sanitize", "json", "spoilers", "markdown", "compact", "split"]
+    assert all(stage["samples"] == 1 for stage in stages.values())
+    assert stages["markdown"]["peak_bytes_max"] > len(TEXT)
+    assert any("telegram_formatter.py" in site for site in stages["json"]["top_sites"])
+    assert "Memory profile" in caplog.text
+    assert not tracemalloc.is_tracing()
+
+
+@pytest.mark.unit
+def test_concurrent_request_is_not_profiled_and_discards_the_sample(profiler):
+    with profiler.profile(0) as outer:
+        assert outer is not None
+        assert format_markdown_for_telegram("**x**", 4096) == ["<b>x</b>"]
+
+    assert outer.concurrent_calls == 1
+    stats = profiler.stats()
+    assert (stats["skipped"], stats["contaminated"], stats["stages"]) == (1, 1, {})
+
+
+@pytest.mark.unit
+def test_sample_overlapping_an_unsampled_call_is_discarded(profiler):
+    profiler.configure(0.5)
+    with profiler.track():
+        with profiler.profile(len(TEXT)) as profile:
+            assert profile is not None
+            with profile.stage("split"):
+                format_markdown_variants(TEXT, {"a": 4096})
+
+    assert profile.concurrent_calls == 2
+    stats = profiler.stats()
+    assert (stats["contaminated"], stats["stages"]) == (1, {})
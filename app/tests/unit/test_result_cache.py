@@ -0,0 +1,62 @@
+from multiprocessing import get_context
+
+from api import dependencies
+from domain.services.result_cache import ResultCache
+
+
+def _store_in_child(path: str) -> None:
+    cache = ResultCache(path, 1024 * 1024)
+    cache.put("shared", "v", ["from child"])
+    cache.close()
+
+
+def test_roundtrip_and_variant_isolation(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), 1024 * 1024)
+    cache.put("text", "max_length=10", ["a", "b"])
+
+    assert cache.get("text", "max_length=10") == ["a", "b"]
+    assert cache.get("text", "max_length=20") is None
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+
+
+def test_results_survive_restart_within_namespace(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = ResultCache(path, 1024 * 1024, namespace="v1")
+    first.put("text", "v", ["persisted"])
+    first.close()
+
+    assert ResultCache(path, 1024 * 1024, namespace="v1").get("text", "v") == ["persisted"]
+    assert ResultCache(path, 1024 * 1024, namespace="v2").get("text", "v") is None
+
+
+def test_size_is_bounded(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), 4096)
+    for index in range(200):
+        cache.put(f"text {index}", "v", ["x" * 100])
+
+    stats = cache.stats()
+    assert 0 < stats.size_bytes <= 4096
+    assert cache.get("text 199", "v") == ["x" * 100]
+    assert cache.get("text 0", "v") is None
+
+
+def test_cache_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path, 1024 * 1024)
+
+    process = get_context("spawn").Process(target=_store_in_child, args=(path,))
+    process.start()
+    process.join(timeout=30)
+
+    assert process.exitcode == 0
+    assert cache.get("shared", "v") == ["from child"]
+
+
+def test_formatter_fingerprint_tracks_dependency_versions(monkeypatch):
+    fingerprint = dependencies._formatter_fingerprint()
+    assert dependencies._formatter_fingerprint() == fingerprint
+
+    monkeypatch.setattr(dependencies, "_distribution_version", lambda name: f"{name}-next")
+
+    assert dependencies._formatter_fingerprint() != fingerprint
@@ -0,0 +1,69 @@
+import socket
+
+import pytest
+
+from config.config import Settings
+import main
+
+
+def test_empty_optional_server_settings_are_none():
+    settings = Settings(SERVER_UDS_PATH="", SERVER_LIMIT_CONCURRENCY="")
+    assert settings.SERVER_UDS_PATH is None
+    assert settings.SERVER_LIMIT_CONCURRENCY is None
+
+
+def test_uds_listener_added_alongside_tcp(monkeypatch):
+    monkeypatch.setattr(main.settings, "SERVER_UDS_PATH", "/tmp/formatter.sock")
+    monkeypatch.setattr(main.settings, "SERVER_BACKLOG", 128)
+    monkeypatch.setattr(main.settings, "SERVER_LIMIT_CONCURRENCY", 50)
+
+    configs = main.build_server_configs()
+
+    assert [config.uds for config in configs] == [None, "/tmp/formatter.sock"]
+    assert (configs[0].host, configs[0].port) == ("0.0.0.0", 9000)
+    assert all(config.backlog == 128 and config.limit_concurrency == 50 for config in configs)
+
+
+def test_no_listeners_rejected(monkeypatch):
+    monkeypatch.setattr(main.settings, "SERVER_TCP_ENABLED", False)
+    monkeypatch.setattr(main.settings, "SERVER_UDS_PATH", None)
+
+    with pytest.raises(RuntimeError):
+        main.build_server_configs()
+
+
+async def test_all_listeners_are_served_by_one_server(monkeypatch, tmp_path):
+    uds_path = tmp_path / "formatter.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(uds_path))
+    stale.close()
+    served: list[tuple[main.Config, list[int]]] = []
+
+    class RecordingServer:
+        def __init__(self, config: main.Config) -> None:
+            self.config = config
+
+        async def serve(self, sockets: list[socket.socket]) -> None:
+            served.append((self.config, [sock.family for sock in sockets]))
+            for sock in sockets:
+                sock.close()
+
+    monkeypatch.setattr(main, "Server", RecordingServer)
+    configs = [main._server_config(host="127.0.0.1", port=0), main._server_config(uds=str(uds_path))]
+
+    await main.run_fastapi(configs)
+
+    assert served == [(configs[0], [socket.AF_INET, socket.AF_UNIX])]
+    assert not uds_path.exists()
+
+
+def test_live_unix_socket_is_not_removed(tmp_path):
+    uds_path = tmp_path / "formatter.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as live:
+        live.bind(str(uds_path))
+        live.listen()
+
+        with pytest.raises(RuntimeError):
+            main.bind_listener_sockets([main._server_config(uds=str(uds_path))])
+
+        assert uds_path.exists()
@@ -0,0 +1,76 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import multiprocessing
+import time
+
+import pytest
+
+from api import warmup
+from api.jobs import JobManager
+from api.warmup import ReadinessState, readiness, warm_up
+from domain.services.telegram_formatter import format_markdown_for_telegram
+
+
+def _manager(factory) -> JobManager:
+    return JobManager(
+        executor_factory=factory,
+        max_pending=1,
+        max_stored_bytes=1024,
+        result_ttl=1.0,
+        retry_after=1,
+        callback_timeout=1.0,
+    )
+
+
+@pytest.mark.unit
+async def test_warm_up_formats_corpus_and_starts_job_workers():
+    executors: list[ThreadPoolExecutor] = []
+
+    def factory() -> ThreadPoolExecutor:
+        executors.append(ThreadPoolExecutor(max_workers=2))
+        return executors[-1]
+
+    manager = _manager(factory)
+    readiness.reset()
+
+    await warm_up(manager, 2, time.monotonic())
+
+    assert readiness.state is ReadinessState.READY
+    assert readiness.warmup_seconds is not None
+    assert len(executors) == 1
+    assert len(executors[0]._threads) == 2
+    await manager.close()
+
+
+@pytest.mark.unit
+async def test_failed_warm_up_is_not_ready(monkeypatch):
+    def broken() -> list[str]:
+        raise RuntimeError("parser unavailable")
+
+    monkeypatch.setattr(warmup, "warm_formatter", broken)
+    readiness.reset()
+
+    await warm_up(None, 0, time.monotonic())
+
+    assert readiness.state is ReadinessState.FAILED
+    assert readiness.as_dict()["error"] == "RuntimeError: parser unavailable"
+    readiness.reset()
+
+
+@pytest.mark.unit
+def test_warm_up_corpus_formats_cleanly():
+    assert warmup.warm_formatter()
+
+
+@pytest.mark.unit
+async def test_job_workers_run_warm_up_in_worker_processes():
+    manager = _manager(partial(ProcessPoolExecutor, max_workers=2, mp_context=multiprocessing.get_context("spawn")))
+
+    warmed = await manager.warm_up(warmup.warm_formatter, 2)
+
+    assert warmed == 2
+    job = manager.submit("`code`", "test", partial(format_markdown_for_telegram, "`code`", 4096))
+    await manager.wait(job, 30.0)
+    assert job.parts == ["<code>code</code>"]
+    await manager.close()
+